@@ -1,32 +1,58 @@
 from datetime import datetime, timezone
 import uuid
+import time
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import PlainTextResponse
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.requests import Request
 from fastapi import HTTPException
+from starlette.websockets import WebSocketState
 from contextlib import asynccontextmanager
-from Application.database import DatabaseEndpoint
+from contextvars import ContextVar
+from Application.database import DatabaseEndpoint, SESSION_DURATION_BINS
+from Application.connections import ConnectionManager
 import uvicorn
+import asyncio
 import json
 from abc import ABC, abstractmethod
 from Config.config import DB_CONFIG
-from Config.config import BACKEND_PROXY_HEADERS
+from Config.config import BACKEND_PROXY_HEADERS, BACKEND_FORWARDED_ALLOW_IPS
 from Config.config import BACKEND_EMAIL
+from Config.config import BACKEND_ADMIN_TOKEN
+from Config.config import IMAGE_PNG_CACHE_SIZE
+from Config.config import STATS_PERSIST_INTERVAL
+from Config.config import DB_MAX_STREAMS, DB_STREAM_TIMEOUT
+from Helpers.Caches import LRUCache
+from Helpers.Images import bitmap_to_png
+from Helpers.ThreadPools import thread_layout
+from Helpers.TrafficCapture import open_recorder
+from Config.config import CAPTURE_PATH, CAPTURE_SAMPLE_RATE, CAPTURE_MAX_BYTES
+from Config.config import WS_MAX_CONNECTIONS, WS_MAX_CONNECTIONS_PER_IP, WS_IDLE_TIMEOUT
+from Config.config import WS_PING_INTERVAL, WS_PING_TIMEOUT, WS_MAX_MESSAGE_BYTES
+from Config.config import WS_SESSION_MEMORY_BUDGET, WS_TOTAL_MEMORY_BUDGET
 import base64
+import hmac
 from pydantic import BaseModel, EmailStr
 import smtplib
 from email.message import EmailMessage
 
+# Optional "id" of the websocket message being handled, echoed in every reply to it
+request_id = ContextVar("request_id", default=None)
+
 #==========================#
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("[Startup] Initializing database connection pool...")
     await app.db.init_db()
+    await app.db.start_statistics()
+    await app.db.start_concurrency_sampling(lambda: app.number_of_clients)
     print("[Startup] Database connection pool initialized.")
     yield
-    print("[Shutdown] Cleaning up...")  # Optional
+    print("[Shutdown] Cleaning up...")
+    await app.db.close()
+    if app.capture is not None:
+        app.capture.close()
 
 #==========================#
 class MyServer(FastAPI, ABC):
@@ -46,6 +72,15 @@ class MyServer(FastAPI, ABC):
         # Members
         self.connected_clients = set()
         self.number_of_clients = 0
+        self.png_cache = LRUCache(max_items=IMAGE_PNG_CACHE_SIZE)
+        self.capture = open_recorder(CAPTURE_PATH, CAPTURE_SAMPLE_RATE, CAPTURE_MAX_BYTES)
+        self.connections = ConnectionManager(
+            max_connections=WS_MAX_CONNECTIONS,
+            max_per_address=WS_MAX_CONNECTIONS_PER_IP,
+            session_memory_budget=WS_SESSION_MEMORY_BUDGET,
+            total_memory_budget=WS_TOTAL_MEMORY_BUDGET,
+            release=self.release_session_state
+        )
 
         self.add_websocket_route("/ws", self.websocket_endpoint)
 
@@ -55,6 +90,10 @@ class MyServer(FastAPI, ABC):
         self.add_api_route("/api/latest_image", self.latest_image_handler, methods=["GET"])
         self.add_api_route("/api/random_image", self.random_image_handler, methods=["GET"])
         self.add_api_route("/api/last_connections", self.last_connections_handler, methods=["GET"])
+        self.add_api_route("/api/connection_stats", self.connection_stats_handler, methods=["GET"])
+        self.add_api_route("/api/model_stats", self.model_stats_handler, methods=["GET"])
+        self.add_api_route("/api/threads", self.threads_handler, methods=["GET"])
+        self.add_api_route("/api/connections", self.connections_handler, methods=["GET"])
         self.add_api_route("/api/contact", self.contact_handler, methods=["POST"])
 
         # Init DB
@@ -64,40 +103,117 @@ class MyServer(FastAPI, ABC):
             user=DB_CONFIG["user"],
             password=DB_CONFIG["password"],
             dbname=DB_CONFIG["dbname"],
-            max_images=2000
+            max_images=2000,
+            stats_interval=STATS_PERSIST_INTERVAL,
+            max_streams=DB_MAX_STREAMS,
+            stream_timeout=DB_STREAM_TIMEOUT
         )
 
     #==========================#
     async def websocket_endpoint(self, websocket: WebSocket):
+        uuidClient = uuid.uuid4()
         await websocket.accept()
+
+        refusal = self.connections.admit(websocket, uuidClient)
+        if refusal is not None:
+            print(f"Refused connection from {websocket.client.host if websocket.client else 'unknown'}: {refusal}")
+            await websocket.close(code=1013, reason=refusal) # Try again later
+            return
+
+        self.connected_clients.add(websocket)
+        self.number_of_clients += 1
+        logged = False
+
+        # Everything acquired above is released in the finally block, whatever ends the session
         try:
-            self.connected_clients.add(websocket)
-            uuidClient = uuid.uuid4()
-            await self.db.log_connection(uuidClient, datetime.now(timezone.utc))
-            self.number_of_clients += 1
+            await self.db.log_connection(uuidClient, datetime.now(timezone.utc), concurrent=self.number_of_clients)
+            logged = True
             await self.on_connect(websocket)
 
+            if self.capture is not None:
+                self.capture.start_session(uuidClient, time.time())
+
             while True:
-                raw_data = await websocket.receive_text()
+                try:
+                    raw_data = await asyncio.wait_for(websocket.receive_text(), timeout=WS_IDLE_TIMEOUT or None)
+                except asyncio.TimeoutError:
+                    print(f"Client {websocket.client.port} idle for {WS_IDLE_TIMEOUT}s, closing.")
+                    await websocket.close(code=1001, reason="Idle timeout")
+                    break
+
+                received_at = time.time()
+                started = time.perf_counter()
+                self.connections.touch(websocket)
 
                 try:
                     data_json = json.loads(raw_data)
                     type = data_json.get("type")
                     data = data_json.get("data")
+                    request_id.set(data_json.get("id"))
+
+                    if type == "ping":
+                        await self.sendMessage(websocket, "pong", data if data is not None else "")
+                        continue
 
                     await self.process_message(type, data, websocket)
 
                 except json.JSONDecodeError:
                     print(f"Invalid JSON received: {raw_data}")
+                except WebSocketDisconnect:
+                    raise
                 except Exception as e:
                     print(f"Error processing message: {e}")
 
+                if self.capture is not None:
+                    self.capture.record_message(uuidClient, received_at, (time.perf_counter() - started) * 1000, raw_data)
+
         except WebSocketDisconnect:
-            await self.on_disconnect(websocket)
-            self.connected_clients.remove(websocket)
-            await self.db.log_disconnection(uuidClient, datetime.now(timezone.utc))
+            pass
+        except Exception as e:
+            print(f"Websocket session {uuidClient} ended with an error: {e}")
+            if websocket.client_state == WebSocketState.CONNECTED:
+                try:
+                    await websocket.close(code=1011) # Internal error
+                except Exception:
+                    pass
+
+        finally:
+            # Bookkeeping first: nothing below may keep the session counted
+            self.connected_clients.discard(websocket)
             self.number_of_clients -= 1
-    
+            session = self.connections.remove(websocket)
+
+            if self.capture is not None:
+                try:
+                    self.capture.end_session(uuidClient, time.time())
+                except Exception as e:
+                    print(f"Error ending capture of session {uuidClient}: {e}")
+
+            try:
+                await self.on_disconnect(websocket)
+            except Exception as e:
+                print(f"Error releasing session {uuidClient}: {e}")
+                for key in (session.memory if session is not None else ()):
+                    try:
+                        self.release_session_state(websocket, key)
+                    except Exception as e:
+                        print(f"Error releasing {key} of session {uuidClient}: {e}")
+
+            if logged:
+                try:
+                    # Sessions open at the moment, counting the one that just ended
+                    await self.db.log_disconnection(uuidClient, datetime.now(timezone.utc), concurrent=self.number_of_clients + 1)
+                except Exception as e:
+                    print(f"Error logging disconnection of {uuidClient}: {e}")
+
+    #==========================#
+    def release_session_state(self, websocket: WebSocket, key: str):
+        """
+        Drop the piece of per-session state accounted under `key`, when the
+        connection manager needs the memory back. Subclasses holding state override this.
+        """
+        pass
+
     #==========================#
     @abstractmethod
     async def process_message(self, type:str, data: str):
@@ -115,28 +231,74 @@ class MyServer(FastAPI, ABC):
 
     #==========================#
     async def last_connections_handler(self, hours: int = Query(default=1, ge=1, le=168)):
-        rows = await self.db.get_connections_last_hours(hours)
+        batches = self.db.iter_connections_last_hours(hours)
 
-        result = []
         try:
-            for row in rows:
-                result.append({
+            first_batch = await anext(batches, None)
+        except Exception as e:
+            print(f"Error processing connection data: {e}")
+            await batches.aclose()
+            return JSONResponse(content={"message": "Error processing connection data."}, status_code=500)
+
+        if not first_batch:
+            await batches.aclose()
+            return JSONResponse(content={"message": "No connections found."}, status_code=404)
+
+        # Stream the rows batch by batch instead of building one large response
+        async def stream():
+            yield b'{"connections":['
+            rows, separator = first_batch, b""
+            while rows:
+                chunk = b",".join(json.dumps({
                     "uuid": str(row["session_uuid"]),
                     "connected_at": row["connected_at"].astimezone().isoformat(),
                     "disconnected_at": (
                         row["disconnected_at"].astimezone().isoformat()
                         if row["disconnected_at"] else None
                     )
-                })
-                
+                }).encode("utf-8") for row in rows)
+                yield separator + chunk
+                rows, separator = await anext(batches, None), b","
+            yield b"]}"
+
+        return ClosingStreamingResponse(stream(), on_close=batches.aclose, media_type="application/json")
+
+    #==========================#
+    async def connection_stats_handler(
+        self,
+        hours: int = Query(default=1, ge=1, le=168),
+        bucket: str = Query(default="hour", pattern="^(minute|hour|day)$"),
+    ):
+        try:
+            rows, histogram = await self.db.get_connection_stats(hours, bucket)
         except Exception as e:
-            print(f"Error processing connection data: {e}")
-            return JSONResponse(content={"message": "Error processing connection data."}, status_code=500)
+            print(f"Error fetching connection stats: {e}")
+            return JSONResponse(content={"message": "Error fetching connection stats."}, status_code=500)
+
+        # Columnar layout with epoch seconds keeps a week of minute buckets compact
+        return JSONResponse(content={
+            "bucket": bucket,
+            "hours": hours,
+            "start": [int(row["bucket"].timestamp()) for row in rows],
+            "connects": [row["connects"] for row in rows],
+            "peak_concurrent": [row["peak_concurrent"] for row in rows],
+            "duration_histogram": {
+                "edges": SESSION_DURATION_BINS,
+                "sessions": histogram
+            }
+        })
 
-        if not result:
-            return JSONResponse(content={"message": "No connections found."}, status_code=404)
+    #==========================#
+    async def model_stats_handler(self):
+        return JSONResponse(content=self.db.stats.snapshot())
 
-        return JSONResponse(content={"connections": result})
+    #==========================#
+    async def threads_handler(self):
+        return JSONResponse(content=thread_layout())
+
+    #==========================#
+    async def connections_handler(self):
+        return JSONResponse(content=self.connections.snapshot())
 
     #==========================#
     async def status_handler(self):
@@ -183,7 +345,7 @@ class MyServer(FastAPI, ABC):
 
             return Response(content=svg, media_type="image/svg+xml")
         
-        image_data = row["image_data"]
+        image_data = self.image_png(row)
 
         return Response(content=image_data, media_type="image/png")
     
@@ -201,7 +363,7 @@ class MyServer(FastAPI, ABC):
             return Response(content=svg, media_type="image/svg+xml")
 
         row = row[0]
-        image_data = row["image_data"]
+        image_data = self.image_png(row)
         
         return Response(content=image_data, media_type="image/png")
 
@@ -212,7 +374,7 @@ class MyServer(FastAPI, ABC):
         images = []
 
         for row in rows:
-            image_data = row["image_data"]
+            image_data = self.image_png(row)
             prediction = row["prediction"]
             real = row["real"]
             client_name = row["client_name"]
@@ -232,10 +394,43 @@ class MyServer(FastAPI, ABC):
         print(f"Returning {len(images)} images.")
         return JSONResponse(content=images)
     
+    #==========================#
+    def require_admin(self, request: Request):
+        token = request.headers.get("X-Admin-Token", "")
+        if not BACKEND_ADMIN_TOKEN or not hmac.compare_digest(token, BACKEND_ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Forbidden")
+
+    #==========================#
+    def image_png(self, row) -> bytes:
+        """
+        PNG for a stored image row, rendered lazily from its bitmap and cached by content hash.
+        """
+        image_hash = row["image_hash"]
+        bitmap = row["bitmap"]
+
+        if image_hash is None or bitmap is None:
+            return row["image_data"] # Legacy row stored as the full canvas PNG
+
+        png = self.png_cache.get(image_hash)
+        if png is None:
+            png = bitmap_to_png(bitmap)
+            self.png_cache.put(image_hash, png)
+
+        return png
+
     #==========================#
     def run(self):
-        print(f"Server running on {self.host}:{self.port} with proxy headers set to {BACKEND_PROXY_HEADERS}.")
-        uvicorn.run(self, host=self.host, port=self.port, proxy_headers=BACKEND_PROXY_HEADERS)
+        print(f"Server running on {self.host}:{self.port} with proxy headers set to {BACKEND_PROXY_HEADERS} (trusted: {BACKEND_FORWARDED_ALLOW_IPS or '127.0.0.1'}).")
+        uvicorn.run(
+            self,
+            host=self.host,
+            port=self.port,
+            proxy_headers=BACKEND_PROXY_HEADERS,
+            forwarded_allow_ips=BACKEND_FORWARDED_ALLOW_IPS or None,
+            ws_ping_interval=WS_PING_INTERVAL or None, # Protocol-level heartbeat drops dead peers
+            ws_ping_timeout=WS_PING_TIMEOUT or None,
+            ws_max_size=WS_MAX_MESSAGE_BYTES
+        )
 
     #==========================#
     async def sendMessage(self, websocket: WebSocket, type: str, data: str):
@@ -247,8 +442,29 @@ class MyServer(FastAPI, ABC):
             print("Invalid message type or data. Cannot send message.")
             return
         
-        message = json.dumps({"type": type, "data": data})
-        await websocket.send_text(message)
+        message = {"type": type, "data": data}
+        if request_id.get() is not None:
+            message["id"] = request_id.get() # Lets clients match replies to their request
+
+        await websocket.send_text(json.dumps(message))
+
+#==========================#
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that always awaits `on_close` once the response is over,
+    including when the client leaves before the body generator was started.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    #==========================#
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
 
 #==========================#
 class ContactForm(BaseModel):
@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from typing import Callable, Optional
+import time
+import uuid
+
+#==========================#
+class Session:
+    """
+    Bookkeeping for one websocket connection: who it is, when it was last
+    heard from, and how many bytes of per-session state the server holds for it.
+    """
+
+    def __init__(self, session_uuid: uuid.UUID, address: str):
+        self.uuid = session_uuid
+        self.address = address
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        self.memory = {} # state key -> bytes held
+
+    #==========================#
+    @property
+    def memory_bytes(self) -> int:
+        return sum(self.memory.values())
+
+#==========================#
+class ConnectionManager:
+    """
+    Admission and resource accounting for websocket sessions. Caps the number of
+    connections globally and per client address, and keeps the per-session state
+    the server holds (last image, strokes) under a per-session and a global byte
+    budget by releasing the state of the least recently active sessions first.
+    """
+
+    def __init__(
+        self,
+        max_connections: int,
+        max_per_address: int,
+        session_memory_budget: int,
+        total_memory_budget: int,
+        release: Callable = None,
+    ):
+        self.max_connections = max_connections
+        self.max_per_address = max_per_address
+        self.session_memory_budget = session_memory_budget
+        self.total_memory_budget = total_memory_budget
+        self.release = release # release(websocket, key) drops that piece of session state
+
+        self.sessions = OrderedDict() # websocket -> Session, least recently active first
+        self.per_address = {}
+        self.memory_bytes = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    #==========================#
+    @staticmethod
+    def address_of(websocket) -> str:
+        return websocket.client.host if websocket.client is not None else "unknown"
+
+    #==========================#
+    def admit(self, websocket, session_uuid: uuid.UUID) -> Optional[str]:
+        """
+        Register a new connection.
+
+        Returns:
+            str: Why the connection was refused, or None when it was admitted.
+        """
+        address = self.address_of(websocket)
+
+        if self.max_connections and len(self.sessions) >= self.max_connections:
+            self.rejected += 1
+            return "Server is at its connection limit"
+        if self.max_per_address and self.per_address.get(address, 0) >= self.max_per_address:
+            self.rejected += 1
+            return "Too many connections from this address"
+
+        self.sessions[websocket] = Session(session_uuid, address)
+        self.per_address[address] = self.per_address.get(address, 0) + 1
+        return None
+
+    #==========================#
+    def touch(self, websocket):
+        session = self.sessions.get(websocket)
+        if session is not None:
+            session.last_seen = time.monotonic()
+            self.sessions.move_to_end(websocket)
+
+    #==========================#
+    def track(self, websocket, key: str, nbytes: int) -> bool:
+        """
+        Account `nbytes` of state stored under `key` for a session, replacing what
+        was accounted for that key before. Other sessions' state is released when
+        the global budget is exceeded.
+
+        Returns:
+            bool: False when the state alone exceeds the session budget and must not be kept.
+        """
+        session = self.sessions.get(websocket)
+        if session is None:
+            return False
+
+        self.memory_bytes -= session.memory.pop(key, 0)
+
+        if self.session_memory_budget and session.memory_bytes + nbytes > self.session_memory_budget:
+            return False
+
+        session.memory[key] = nbytes
+        self.memory_bytes += nbytes
+
+        if self.total_memory_budget:
+            for other in list(self.sessions):
+                if self.memory_bytes <= self.total_memory_budget:
+                    break
+                if other is not websocket and self.sessions[other].memory:
+                    self.evict(other)
+
+        return True
+
+    #==========================#
+    def untrack(self, websocket, key: str):
+        session = self.sessions.get(websocket)
+        if session is not None:
+            self.memory_bytes -= session.memory.pop(key, 0)
+
+    #==========================#
+    def evict(self, websocket):
+        """
+        Release all state held for a session, keeping the connection open.
+        """
+        session = self.sessions[websocket]
+        for key in list(session.memory):
+            if self.release is not None:
+                self.release(websocket, key)
+            self.memory_bytes -= session.memory.pop(key, 0)
+        self.evicted += 1
+
+    #==========================#
+    def remove(self, websocket) -> Optional[Session]:
+        """
+        Forget a connection. Safe to call more than once.
+        """
+        session = self.sessions.pop(websocket, None)
+        if session is None:
+            return None
+
+        self.memory_bytes -= session.memory_bytes
+        remaining = self.per_address.get(session.address, 1) - 1
+        if remaining > 0:
+            self.per_address[session.address] = remaining
+        else:
+            self.per_address.pop(session.address, None)
+        return session
+
+    #==========================#
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "connections": len(self.sessions),
+            "addresses": len(self.per_address),
+            "max_connections": self.max_connections,
+            "max_per_address": self.max_per_address,
+            "memory_bytes": self.memory_bytes,
+            "memory_budget": self.total_memory_budget,
+            "session_memory_budget": self.session_memory_budget,
+            "oldest_session_seconds": round(max((now - s.connected_at for s in self.sessions.values()), default=0.0), 3),
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
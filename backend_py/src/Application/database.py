@@ -1,11 +1,26 @@
 from datetime import datetime, timedelta, timezone
+from bisect import bisect_right
+from Application.statistics import PredictionStatistics
 import asyncpg
 import asyncio
-from typing import Optional
+import hashlib
+import json
+from typing import AsyncIterator, Callable, Optional
+
+# Upper edges (in seconds) of the session-duration histogram bins. A session
+# lasting d seconds falls in bin bisect_right(SESSION_DURATION_BINS, d), so the
+# histogram has len(SESSION_DURATION_BINS) + 1 bins, the last one open-ended.
+SESSION_DURATION_BINS = [10, 30, 60, 300, 900, 1800, 3600]
+
+# Time buckets the connection rollups can be served at (postgres date_trunc units)
+ROLLUP_BUCKETS = ("minute", "hour", "day")
+
+# Rollups are served for at most 168 hours, older ones are pruned
+ROLLUP_RETENTION_HOURS = 169
 
 #==========================#
 class DatabaseEndpoint:
-    def __init__(self, host: str, port: int, user: str, password: str, dbname: str, max_images: int = 2000):
+    def __init__(self, host: str, port: int, user: str, password: str, dbname: str, max_images: int = 2000, stats_interval: float = 30.0, max_streams: int = 2, stream_timeout: float = 30.0):
         self.dsn = f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
         self.max_images = max_images
         self.pool: Optional[asyncpg.Pool] = None
@@ -15,30 +30,101 @@ class DatabaseEndpoint:
         self._cleanup_lock = asyncio.Lock()
         self._cleanup_interval = 1.5 # seconds
 
+        # Long-lived cursor streams, kept from starving the pool
+        self._stream_semaphore = asyncio.Semaphore(max_streams)
+        self._stream_timeout = stream_timeout
+
+        # Model quality counters, persisted every `stats_interval` seconds
+        self.stats = PredictionStatistics()
+        self._stats_task: Optional[asyncio.Task] = None
+        self._stats_interval = stats_interval
+
+        # Concurrent-session samples, so minutes without connects still record their peak
+        self._concurrency_task: Optional[asyncio.Task] = None
+
     #==========================#
     async def init_db(self):
         if self.pool is None:
             self.pool = await asyncpg.create_pool(dsn=self.dsn)
 
+    #==========================#
+    async def start_statistics(self):
+        """
+        Load the persisted prediction statistics and save them periodically until close().
+        Only the server does this, so offline tools never write the live counters.
+        """
+        if self._stats_task is None:
+            await self.load_prediction_stats()
+            self._stats_task = asyncio.create_task(self._persist_stats_periodically())
+
+    #==========================#
+    async def start_concurrency_sampling(self, count: Callable[[], int], interval: float = 60.0):
+        """
+        Record `count()` open sessions in the connection rollups every `interval`
+        seconds and prune old rollups, until close().
+        """
+        if self._concurrency_task is None:
+            self._concurrency_task = asyncio.create_task(self._sample_concurrency_periodically(count, interval))
+
+    #==========================#
+    async def _sample_concurrency_periodically(self, count: Callable[[], int], interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                concurrent = count()
+                if concurrent > 0:
+                    await self.record_concurrency(datetime.now(timezone.utc), concurrent)
+                await self.cleanup_rollups()
+            except Exception as e:
+                print(f"Error sampling concurrent connections: {e}")
+
+    #==========================#
+    async def close(self):
+        if self._concurrency_task is not None:
+            self._concurrency_task.cancel()
+            self._concurrency_task = None
+
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            self._stats_task = None
+            await self.save_prediction_stats()
+
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
     #==========================#
     async def insert_and_cleanup_image(
         self,
-        image_data: bytes,
+        bitmap: bytes,
         prediction: int,
         real: int,
         client_port: int,
         client_name: str,
+        original: Optional[bytes] = None,
     ):
         if self.pool is None:
             raise RuntimeError("Database not initialized. Call `init_db()` first.")
 
+        image_hash = hashlib.sha256(bitmap).digest()
+
         async with self.pool.acquire() as conn:
             async with conn.transaction():
+                # Store the bitmap once; duplicates only refresh last_used_at so the
+                # orphan sweep in cleanup_images cannot race with this insert.
+                await conn.execute("""
+                    INSERT INTO image_blobs (hash, bitmap, original)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (hash) DO UPDATE SET last_used_at = now()
+                """, image_hash, bitmap, original)
+
                 # Insert the new image
                 await conn.execute("""
-                    INSERT INTO mnist_images (image_data, prediction, real, client_port, client_name)
+                    INSERT INTO mnist_images (image_hash, prediction, real, client_port, client_name)
                     VALUES ($1, $2, $3, $4, $5)
-                """, image_data, prediction, real, client_port, client_name)
+                """, image_hash, prediction, real, client_port, client_name)
+
+        self.stats.record(prediction, real)
         
         await self.debounce_cleanup(delay=self._cleanup_interval)
     
@@ -47,11 +133,13 @@ class DatabaseEndpoint:
         if self.pool is None:
             raise RuntimeError("Database not initialized. Call init_db() first.")
 
+        # Rows stored before content-addressing only have the legacy image_data PNG
         async with self.pool.acquire() as conn:
             rows = await conn.fetch("""
-                SELECT image_data, prediction, real, client_name
-                FROM mnist_images
-                ORDER BY created_at DESC
+                SELECT m.image_hash, b.bitmap, m.image_data, m.prediction, m.real, m.client_name
+                FROM mnist_images m
+                LEFT JOIN image_blobs b ON b.hash = m.image_hash
+                ORDER BY m.created_at DESC
                 LIMIT $1    
             """, limit)
 
@@ -66,19 +154,44 @@ class DatabaseEndpoint:
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow("""
                 WITH recent_images AS (
-                    SELECT image_data, prediction, real, client_name
+                    SELECT image_hash, image_data, prediction, real, client_name
                     FROM mnist_images
                     ORDER BY created_at DESC
                     LIMIT 30
                 )
-                SELECT image_data, prediction, real, client_name
-                FROM recent_images
+                SELECT r.image_hash, b.bitmap, r.image_data, r.prediction, r.real, r.client_name
+                FROM recent_images r
+                LEFT JOIN image_blobs b ON b.hash = r.image_hash
                 ORDER BY RANDOM()
                 LIMIT 1
             """)
 
         return row if row else None
     
+    #==========================#
+    async def iter_labeled_images(self, batch_size: int = 512) -> AsyncIterator[list]:
+        """
+        Stream every labeled image through a server-side cursor, `batch_size` rows at a time.
+        """
+        if self.pool is None:
+            raise RuntimeError("Database not initialized. Call init_db() first.")
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor("""
+                    SELECT m.id, m.image_hash, b.bitmap, m.image_data, m.prediction, m.real
+                    FROM mnist_images m
+                    LEFT JOIN image_blobs b ON b.hash = m.image_hash
+                    WHERE m.real BETWEEN 0 AND 9
+                    ORDER BY m.id
+                """)
+
+                while True:
+                    rows = await cursor.fetch(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
     #==========================#
     async def debounce_cleanup(self, delay: float = 1.5):
         async with self._cleanup_lock:
@@ -93,6 +206,7 @@ class DatabaseEndpoint:
         try:
             await asyncio.sleep(delay)
             await self.cleanup_images()
+            await self.cleanup_rollups()
         except asyncio.CancelledError:
             pass  # Expected if debounce reschedules the cleanup
 
@@ -113,45 +227,235 @@ class DatabaseEndpoint:
                 )
             """, self.max_images)
 
+            # Drop bitmaps no retained image refers to anymore
+            await conn.execute("""
+                DELETE FROM image_blobs b
+                WHERE b.last_used_at < now() - interval '1 minute'
+                AND NOT EXISTS (
+                    SELECT 1 FROM mnist_images m WHERE m.image_hash = b.hash
+                )
+            """)
+
     #==========================#
-    async def log_connection(self, uuid: str, connected_at: datetime):
+    async def cleanup_rollups(self):
+        if self.pool is None:
+            raise RuntimeError("Database not initialized.")
+
+        since_time = datetime.now(timezone.utc) - timedelta(hours=ROLLUP_RETENTION_HOURS)
+
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM connection_rollups WHERE bucket < $1", since_time)
+            await conn.execute("DELETE FROM connection_duration_rollups WHERE bucket < $1", since_time)
+
+    #==========================#
+    async def load_prediction_stats(self):
+        """
+        Restore the persisted counters. The very first time, seed them once from
+        the images still in the table.
+        """
+        async with self.pool.acquire() as conn:
+            payload = await conn.fetchval("SELECT payload FROM prediction_stats WHERE id = 1")
+
+            if payload is not None:
+                self.stats = PredictionStatistics.from_payload(json.loads(payload))
+                return
+
+            rows = await conn.fetch("""
+                SELECT prediction, real, date_trunc('hour', created_at) AS hour, COUNT(*)::integer AS count
+                FROM mnist_images
+                WHERE real BETWEEN 0 AND 9
+                GROUP BY 1, 2, 3
+                ORDER BY 3
+            """)
+
+        self.stats = PredictionStatistics()
+        for row in rows:
+            hour = row["hour"] or datetime.now(timezone.utc)
+            if hour.tzinfo is None:
+                hour = hour.replace(tzinfo=timezone.utc)
+            self.stats.record(row["prediction"], row["real"], at=hour, count=row["count"])
+
+        await self.save_prediction_stats()
+
+    #==========================#
+    async def save_prediction_stats(self):
         if self.pool is None:
             raise RuntimeError("Database not initialized. Call init_db() first.")
 
+        # Clear the flag first so submissions recorded during the write stay dirty
+        self.stats.dirty = False
+        payload = json.dumps(self.stats.to_payload())
+
         async with self.pool.acquire() as conn:
             await conn.execute("""
-                INSERT INTO connections (session_uuid, connected_at)
-                VALUES ($1, $2)
-            """, uuid, connected_at)
-    
+                INSERT INTO prediction_stats (id, payload, updated_at)
+                VALUES (1, $1::jsonb, now())
+                ON CONFLICT (id) DO UPDATE
+                SET payload = EXCLUDED.payload, updated_at = EXCLUDED.updated_at
+            """, payload)
+
+    #==========================#
+    async def _persist_stats_periodically(self):
+        while True:
+            await asyncio.sleep(self._stats_interval)
+            if not self.stats.dirty:
+                continue
+            try:
+                await self.save_prediction_stats()
+            except Exception as e:
+                self.stats.dirty = True
+                print(f"Error persisting prediction stats: {e}")
+
+    #==========================#
+    async def log_connection(self, uuid: str, connected_at: datetime, concurrent: int = 0):
+        if self.pool is None:
+            raise RuntimeError("Database not initialized. Call init_db() first.")
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO connections (session_uuid, connected_at)
+                    VALUES ($1, $2)
+                """, uuid, connected_at)
+
+                # Per-minute rollup: connect count and concurrent-session peak
+                await conn.execute("""
+                    INSERT INTO connection_rollups (bucket, connects, peak_concurrent)
+                    VALUES (date_trunc('minute', $1::timestamptz), 1, $2)
+                    ON CONFLICT (bucket) DO UPDATE
+                    SET connects = connection_rollups.connects + 1,
+                        peak_concurrent = GREATEST(connection_rollups.peak_concurrent, EXCLUDED.peak_concurrent)
+                """, connected_at, concurrent)
+
     #==========================#
-    async def log_disconnection(self, uuid: str, disconnected_at: datetime):
+    async def record_concurrency(self, at: datetime, concurrent: int):
+        """
+        Raise the concurrent-session peak of the minute containing `at`, without counting a connect.
+        """
         if self.pool is None:
             raise RuntimeError("Database not initialized. Call init_db() first.")
 
         async with self.pool.acquire() as conn:
             await conn.execute("""
-                UPDATE connections
-                SET disconnected_at = $1
-                WHERE session_uuid = $2 AND disconnected_at IS NULL
-            """, disconnected_at, uuid)
+                INSERT INTO connection_rollups (bucket, connects, peak_concurrent)
+                VALUES (date_trunc('minute', $1::timestamptz), 0, $2)
+                ON CONFLICT (bucket) DO UPDATE
+                SET peak_concurrent = GREATEST(connection_rollups.peak_concurrent, EXCLUDED.peak_concurrent)
+            """, at, concurrent)
 
     #==========================#
-    async def get_connections_last_hours(self, hours: int = 1):
+    async def log_disconnection(self, uuid: str, disconnected_at: datetime, concurrent: int = 0):
+        if self.pool is None:
+            raise RuntimeError("Database not initialized. Call init_db() first.")
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Per-minute rollup: the sessions open until now count toward this minute's peak
+                await conn.execute("""
+                    INSERT INTO connection_rollups (bucket, connects, peak_concurrent)
+                    VALUES (date_trunc('minute', $1::timestamptz), 0, $2)
+                    ON CONFLICT (bucket) DO UPDATE
+                    SET peak_concurrent = GREATEST(connection_rollups.peak_concurrent, EXCLUDED.peak_concurrent)
+                """, disconnected_at, concurrent)
+
+                connected_at = await conn.fetchval("""
+                    UPDATE connections
+                    SET disconnected_at = $1
+                    WHERE session_uuid = $2 AND disconnected_at IS NULL
+                    RETURNING connected_at
+                """, disconnected_at, uuid)
+
+                if connected_at is None:
+                    return
+
+                if connected_at.tzinfo is None:
+                    connected_at = connected_at.replace(tzinfo=timezone.utc)
+
+                duration = (disconnected_at - connected_at).total_seconds()
+                duration_bin = bisect_right(SESSION_DURATION_BINS, duration)
+
+                # Per-minute rollup: session-duration histogram
+                await conn.execute("""
+                    INSERT INTO connection_duration_rollups (bucket, bin, sessions)
+                    VALUES (date_trunc('minute', $1::timestamptz), $2, 1)
+                    ON CONFLICT (bucket, bin) DO UPDATE
+                    SET sessions = connection_duration_rollups.sessions + 1
+                """, disconnected_at, duration_bin)
+
+    #==========================#
+    async def iter_connections_last_hours(self, hours: int = 1, batch_size: int = 500) -> AsyncIterator[list]:
+        """
+        Stream the connection rows of the last `hours` hours through a server-side
+        cursor, `batch_size` rows at a time, instead of materializing them all.
+
+        A stream holds a pooled connection until it is closed, so at most
+        `max_streams` run at once and postgres ends any that stall for longer
+        than `stream_timeout` seconds.
+        """
         if self.pool is None:
             raise RuntimeError("Database not initialized. Call init_db() first.")
 
+        since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
+        timeout_ms = int(self._stream_timeout * 1000)
+
+        async with self._stream_semaphore, self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL statement_timeout = {timeout_ms}")
+                await conn.execute(f"SET LOCAL idle_in_transaction_session_timeout = {timeout_ms}")
+
+                cursor = await conn.cursor("""
+                    SELECT session_uuid, connected_at, disconnected_at
+                    FROM connections
+                    WHERE connected_at >= $1
+                    ORDER BY connected_at DESC
+                """, since_time)
+
+                while True:
+                    rows = await cursor.fetch(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    #==========================#
+    async def get_connection_stats(self, hours: int = 1, bucket: str = "hour"):
+        """
+        Aggregate the per-minute connection rollups of the last `hours` hours into
+        `bucket`-sized buckets ("minute", "hour" or "day").
+
+        Returns:
+            tuple: (rows of (bucket, connects, peak_concurrent), duration histogram counts)
+        """
+        if self.pool is None:
+            raise RuntimeError("Database not initialized. Call init_db() first.")
+
+        if bucket not in ROLLUP_BUCKETS:
+            raise ValueError(f"Unknown rollup bucket: {bucket}")
+
         since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
 
         async with self.pool.acquire() as conn:
             rows = await conn.fetch("""
-                SELECT session_uuid, connected_at, disconnected_at
-                FROM connections
-                WHERE connected_at >= $1
-                ORDER BY connected_at DESC
+                SELECT date_trunc($2, bucket) AS bucket,
+                       SUM(connects)::integer AS connects,
+                       MAX(peak_concurrent) AS peak_concurrent
+                FROM connection_rollups
+                WHERE bucket >= date_trunc('minute', $1::timestamptz)
+                GROUP BY 1
+                ORDER BY 1
+            """, since_time, bucket)
+
+            bins = await conn.fetch("""
+                SELECT bin, SUM(sessions)::integer AS sessions
+                FROM connection_duration_rollups
+                WHERE bucket >= date_trunc('minute', $1::timestamptz)
+                GROUP BY bin
             """, since_time)
 
-        return rows
+        histogram = [0] * (len(SESSION_DURATION_BINS) + 1)
+        for row in bins:
+            histogram[row["bin"]] = row["sessions"]
+
+        return rows, histogram
 
     async def store_contact_message(self, from_email: str, subject: str, message: str):
         if self.pool is None:
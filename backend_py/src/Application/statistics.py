@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+NUM_CLASSES = 10
+WINDOW_HOURS = 168 # Hourly accuracy buckets kept for the windowed series
+
+#==========================#
+class PredictionStatistics:
+    """
+    Running model-quality counters over every labeled submission: totals, a
+    confusion matrix (rows are the real label, columns the prediction) and
+    hourly accuracy buckets. Updated in O(1) per submission and independent of
+    image retention, so they never need a table scan.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.correct = 0
+        self.confusion = [[0] * NUM_CLASSES for _ in range(NUM_CLASSES)]
+        self.hourly = {} # hour start (epoch seconds) -> [total, correct]
+        self.dirty = False
+        self._snapshot: Optional[dict] = None
+
+    #==========================#
+    def record(self, prediction: int, real: int, at: Optional[datetime] = None, count: int = 1):
+        if not (0 <= real < NUM_CLASSES and 0 <= prediction < NUM_CLASSES):
+            return
+
+        hit = count if prediction == real else 0
+        self.total += count
+        self.correct += hit
+        self.confusion[real][prediction] += count
+
+        at = at or datetime.now(timezone.utc)
+        hour = int(at.timestamp()) // 3600 * 3600
+        if hour not in self.hourly:
+            self.hourly[hour] = [0, 0]
+
+            # Drop hourly buckets that fell out of the window, once per new hour
+            cutoff = hour - WINDOW_HOURS * 3600
+            for key in [key for key in self.hourly if key <= cutoff]:
+                del self.hourly[key]
+
+        bucket = self.hourly[hour]
+        bucket[0] += count
+        bucket[1] += hit
+
+        self.dirty = True
+        self._snapshot = None
+
+    #==========================#
+    def snapshot(self) -> dict:
+        """
+        Dashboard view of the counters, cached until the next submission.
+        """
+        if self._snapshot is not None:
+            return self._snapshot
+
+        per_class_accuracy = []
+        for real, row in enumerate(self.confusion):
+            support = sum(row)
+            per_class_accuracy.append(row[real] / support if support else None)
+
+        hours = sorted(self.hourly)
+        self._snapshot = {
+            "total": self.total,
+            "correct": self.correct,
+            "accuracy": self.correct / self.total if self.total else None,
+            "per_class_accuracy": per_class_accuracy,
+            "confusion_matrix": self.confusion,
+            "hourly": {
+                "start": hours,
+                "total": [self.hourly[hour][0] for hour in hours],
+                "correct": [self.hourly[hour][1] for hour in hours],
+            },
+        }
+        return self._snapshot
+
+    #==========================#
+    def to_payload(self) -> dict:
+        return {
+            "total": self.total,
+            "correct": self.correct,
+            "confusion": self.confusion,
+            "hourly": {str(hour): counts for hour, counts in self.hourly.items()},
+        }
+
+    #==========================#
+    @classmethod
+    def from_payload(cls, payload: dict) -> "PredictionStatistics":
+        stats = cls()
+        stats.total = payload["total"]
+        stats.correct = payload["correct"]
+        stats.confusion = payload["confusion"]
+        stats.hourly = {int(hour): counts for hour, counts in payload["hourly"].items()}
+        return stats
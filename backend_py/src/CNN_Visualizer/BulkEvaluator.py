@@ -0,0 +1,239 @@
+from CNN_Visualizer.CNNModelHolder import LeNetLoader
+from Helpers.ThreadPools import run_in_bulk_executor
+from colorama import Fore, Style
+import numpy as np
+import argparse
+import asyncio
+import time
+import os
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp")
+
+#==========================#
+class EvaluationReport:
+    """
+    Running accuracy counters for a bulk evaluation, filled batch by batch.
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.labeled = 0
+        self.correct = 0
+        self.stored = 0
+        self.stored_correct = 0
+        self.agreement = 0
+        self.confusion = np.zeros((10, 10), dtype=np.int64) # [real, prediction]
+        self.started_at = time.perf_counter()
+
+    #==========================#
+    def update(self, predictions: np.ndarray, labels: np.ndarray = None, stored: np.ndarray = None):
+        self.images += len(predictions)
+
+        if labels is None:
+            return
+
+        mask = (labels >= 0) & (labels <= 9)
+        self.labeled += int(mask.sum())
+        self.correct += int((predictions[mask] == labels[mask]).sum())
+        np.add.at(self.confusion, (labels[mask], predictions[mask]), 1)
+
+        if stored is not None:
+            stored_mask = mask & (stored >= 0)
+            self.stored += int(stored_mask.sum())
+            self.stored_correct += int((stored[stored_mask] == labels[stored_mask]).sum())
+            self.agreement += int((stored[stored_mask] == predictions[stored_mask]).sum())
+
+    #==========================#
+    def to_dict(self) -> dict:
+        per_class_total = self.confusion.sum(axis=1)
+        per_class_correct = np.diag(self.confusion)
+
+        return {
+            "images": self.images,
+            "labeled": self.labeled,
+            "accuracy": self.correct / self.labeled if self.labeled else None,
+            "stored_accuracy": self.stored_correct / self.stored if self.stored else None,
+            "agreement_with_stored": self.agreement / self.stored if self.stored else None,
+            "changed_predictions": self.stored - self.agreement,
+            "per_class_accuracy": [
+                float(c / t) if t else None for c, t in zip(per_class_correct, per_class_total)
+            ],
+            "confusion_matrix": self.confusion.tolist(),
+            "seconds": round(time.perf_counter() - self.started_at, 3),
+        }
+
+#==========================#
+class BulkEvaluator:
+    """
+    Re-scores many images with a LeNet checkpoint in large batches, without visuals.
+    Work runs on the single-worker bulk executor so live inference keeps its threads.
+    """
+
+    def __init__(self, model_holder: LeNetLoader, batch_size: int = 512):
+        self.modelHolder = model_holder
+        self.batch_size = batch_size
+
+    #==========================#
+    def predict_bitmaps(self, bitmaps: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            bitmaps (np.ndarray): A [N, 28, 28] uint8 stack of grayscale bitmaps.
+
+        Returns:
+            np.ndarray: The N predicted labels.
+        """
+        predictions = []
+        for start in range(0, len(bitmaps), self.batch_size):
+            tensor = self.modelHolder.bitmap_to_tensor(bitmaps[start:start + self.batch_size])
+            batch_predictions, _ = self.modelHolder.predict_batch(tensor)
+            predictions.append(batch_predictions)
+
+        return np.concatenate(predictions) if predictions else np.zeros(0, dtype=np.int64)
+
+    #==========================#
+    def _score_rows(self, rows: list):
+        bitmaps, labels, stored = [], [], []
+        for row in rows:
+            if row["bitmap"] is not None:
+                bitmap = np.frombuffer(row["bitmap"], dtype=np.uint8).reshape(28, 28)
+            else:
+                bitmap = self.modelHolder.data_to_bitmap(row["image_data"]) # Legacy PNG row
+            if bitmap is None:
+                continue
+            bitmaps.append(bitmap)
+            labels.append(row["real"])
+            stored.append(row["prediction"])
+
+        if not bitmaps:
+            return None
+
+        predictions = self.predict_bitmaps(np.stack(bitmaps))
+        return predictions, np.array(labels), np.array(stored)
+
+    #==========================#
+    async def evaluate_database(self, db) -> dict:
+        report = EvaluationReport()
+
+        async for rows in db.iter_labeled_images(batch_size=self.batch_size):
+            scored = await run_in_bulk_executor(self._score_rows, rows)
+            if scored is not None:
+                report.update(*scored)
+
+        return report.to_dict()
+
+    #==========================#
+    async def evaluate_arrays(self, bitmaps: np.ndarray, labels: np.ndarray = None) -> dict:
+        report = EvaluationReport()
+
+        for start in range(0, len(bitmaps), self.batch_size):
+            batch = bitmaps[start:start + self.batch_size]
+            predictions = await run_in_bulk_executor(self.predict_bitmaps, batch)
+            report.update(predictions, None if labels is None else labels[start:start + self.batch_size])
+
+        return report.to_dict()
+
+#==========================#
+def load_npy(path) -> np.ndarray:
+    """
+    Load a [N, 28, 28] image stack from a .npy file (path or file object) as uint8 bitmaps.
+    Float arrays are assumed to be in [0, 1], integer arrays in [0, 255] and
+    bool arrays are masks of white pixels.
+    """
+    array = np.load(path, allow_pickle=False)
+    if array.ndim == 4 and array.shape[1] == 1:
+        array = array[:, 0]
+    if array.ndim != 3 or array.shape[1:] != (28, 28):
+        raise ValueError(f"Expected a [N, 28, 28] array, got {array.shape}")
+
+    if array.dtype == np.uint8:
+        return array
+    if np.issubdtype(array.dtype, np.floating):
+        return np.clip(np.asarray(array, dtype=np.float32) * 255.0, 0, 255).astype(np.uint8)
+    if array.dtype == np.bool_:
+        return array.astype(np.uint8) * 255
+    if np.issubdtype(array.dtype, np.integer):
+        if array.size and (array.min() < 0 or array.max() > 255):
+            raise ValueError(f"Integer pixels must be in [0, 255], got [{array.min()}, {array.max()}]")
+        return array.astype(np.uint8)
+    raise ValueError(f"Unsupported pixel dtype {array.dtype}")
+
+#==========================#
+def load_folder(path: str, model_holder: LeNetLoader):
+    """
+    Load every image below `path`. Images inside a folder named after a digit
+    (e.g. `path/7/drawing.png`) are labeled with that digit, others get -1.
+
+    Returns:
+        tuple: ([N, 28, 28] uint8 bitmaps, [N] labels)
+    """
+    bitmaps, labels = [], []
+    for root, _, files in os.walk(path):
+        folder = os.path.basename(root)
+        label = int(folder) if folder.isdigit() and len(folder) == 1 else -1
+
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(root, name), "rb") as f:
+                bitmap = model_holder.data_to_bitmap(f.read())
+            if bitmap is not None:
+                bitmaps.append(bitmap)
+                labels.append(label)
+
+    if not bitmaps:
+        return np.zeros((0, 28, 28), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+
+    return np.stack(bitmaps), np.array(labels)
+
+#==========================#
+async def _main(args):
+    model_holder = LeNetLoader(model_path=args.model, dataset="mnist")
+    if not model_holder.load_model():
+        raise SystemExit(1)
+
+    evaluator = BulkEvaluator(model_holder, batch_size=args.batch_size)
+
+    if args.npy:
+        labels = np.load(args.labels, allow_pickle=False) if args.labels else None
+        return await evaluator.evaluate_arrays(load_npy(args.npy), labels)
+
+    if args.folder:
+        return await evaluator.evaluate_arrays(*load_folder(args.folder, model_holder))
+
+    from Application.database import DatabaseEndpoint
+    from Config.config import DB_CONFIG
+
+    db = DatabaseEndpoint(**DB_CONFIG)
+    await db.init_db()
+    try:
+        return await evaluator.evaluate_database(db)
+    finally:
+        await db.close()
+
+#==========================#
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored or local MNIST drawings with a LeNet checkpoint.")
+    parser.add_argument("--model", default="other/Models/mnist_leNet.pth", help="Checkpoint to evaluate")
+    parser.add_argument("--batch-size", type=int, default=512)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--npy", help="A [N, 28, 28] .npy image stack instead of the database")
+    source.add_argument("--folder", help="A folder of images instead of the database (digit subfolders are labels)")
+    parser.add_argument("--labels", help="A [N] .npy label array for --npy")
+    args = parser.parse_args()
+
+    report = asyncio.run(_main(args))
+
+    accuracy = report["accuracy"]
+    stored_accuracy = report["stored_accuracy"]
+    print(Fore.GREEN, f"Evaluated {report['images']} images ({report['labeled']} labeled) in {report['seconds']}s", Style.RESET_ALL)
+    if accuracy is not None:
+        print(f"Accuracy: {accuracy:.4f}")
+    if stored_accuracy is not None:
+        print(f"Stored prediction accuracy: {stored_accuracy:.4f}")
+        print(f"Agreement with stored predictions: {report['agreement_with_stored']:.4f} ({report['changed_predictions']} changed)")
+    for digit, value in enumerate(report["per_class_accuracy"]):
+        if value is not None:
+            print(f"  {digit}: {value:.4f}")
+
+if __name__ == "__main__":
+    main()
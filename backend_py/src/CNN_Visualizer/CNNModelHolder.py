@@ -4,7 +4,10 @@ import torch.nn.functional as F
 from colorama import Fore, Style
 import numpy as np
 from PIL import Image
-from torchvision import transforms
+import threading
+import hashlib
+import struct
+import json
 import io
 
 #==========================#
@@ -14,19 +17,83 @@ class LeNetLoader:
         self.model_path = model_path
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
+        # Checkpoint-only visuals, computed once per load
+        self.model_version = None
+        self.static_visuals = b""
+
     #==========================#
-    def load_model(self):
+    def load_model(self) -> bool:
         try:
             state_dict = torch.load(self.model_path, map_location=torch.device('cpu'))
             self.model.load_state_dict(state_dict)
             self.model.eval()  # Set the model to evaluation mode
+
+            with open(self.model_path, "rb") as f:
+                self.model_version = hashlib.sha256(f.read()).hexdigest()[:16]
+            self.static_visuals = self.encode_static_visuals()
+
             print(Fore.GREEN, f"Model loaded successfully from {self.model_path}", Style.RESET_ALL)
+            return True
         except Exception as e:
             print(Fore.RED, f"Error loading model: {e}", Style.RESET_ALL)
+            return False
 
     #==========================#
     def get_model(self):
         return self.model
+
+    #==========================#
+    def encode_static_visuals(self) -> bytes:
+        """
+        Encode everything that only depends on the checkpoint (kernels, FC weights
+        and layer shapes) into one compact binary blob:
+
+            uint32 big-endian manifest length | UTF-8 JSON manifest | uint8 pixels
+
+        Each manifest visual gives its title, width, height and the offset of its
+        width * height row-major pixels in the pixel section.
+
+        Returns:
+            bytes: The encoded static visuals.
+        """
+        model = self.model
+        visuals = []
+
+        with torch.no_grad():
+            conv1 = model.conv1.weight.cpu().numpy() # [6, in, 5, 5]
+            for i in range(conv1.shape[0]):
+                visuals.append(model.prepare_visuals(f"Conv1 Kernel {i}", conv1[i].transpose(1, 0, 2).reshape(conv1.shape[2], -1)))
+
+            # Each conv2 kernel spans the 6 pool1 maps, laid out side by side
+            conv2 = model.conv2.weight.cpu().numpy() # [16, 6, 5, 5]
+            for i in range(conv2.shape[0]):
+                visuals.append(model.prepare_visuals(f"Conv2 Kernel {i}", conv2[i].transpose(1, 0, 2).reshape(conv2.shape[2], -1)))
+
+            for name in ("fc1", "fc2", "fc3"):
+                weight = getattr(model, name).weight.cpu().numpy() # [out, in]
+                visuals.append(model.prepare_visuals(f"{name.upper()} Weights ({weight.shape[0]}x{weight.shape[1]})", weight))
+
+        layers = []
+        for name, module in model.named_children():
+            layers.append({
+                "name": name,
+                "type": type(module).__name__,
+                "parameters": {key: list(value.shape) for key, value in module.named_parameters()},
+            })
+
+        manifest = {"version": self.model_version, "layers": layers, "visuals": []}
+        pixels = bytearray()
+        for visual in visuals:
+            manifest["visuals"].append({
+                "title": visual["title"],
+                "width": int(visual["width"]),
+                "height": int(visual["height"]),
+                "offset": len(pixels),
+            })
+            pixels += bytes(visual["data"])
+
+        header = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+        return struct.pack(">I", len(header)) + header + bytes(pixels)
     
     #==========================#
     def predict(self, image: torch.Tensor):
@@ -58,7 +125,123 @@ class LeNetLoader:
         except Exception as e:
             print(Fore.RED, f"Error during prediction: {e}", Style.RESET_ALL)
             return -1, []
+
+    #==========================#
+    def predict_batch(self, images: torch.Tensor):
+        """
+        Perform inference on a batch of MNIST image tensors, without visuals.
+
+        Args:
+            images (torch.Tensor): A [N, 1, 28, 28] or [N, 28, 28] batch (values in -1–1).
+
+        Returns:
+            tuple: (np.ndarray of N predicted labels, np.ndarray of [N, 10] probabilities)
+        """
+        if images.ndim == 3:
+            images = images.unsqueeze(1)
+
+        images = images.to(self.device).float()
+
+        with torch.no_grad():
+            output = self.model(images, save_visuals=False)
+            probabilities = torch.exp(output) # output is log_softmax
+            predictions = torch.argmax(output, dim=1)
+
+        return predictions.cpu().numpy(), probabilities.cpu().numpy()
+
+    #==========================#
+    def saliency(self, image: torch.Tensor, target: int, patch: int = 4, stride: int = 2):
+        """
+        Compute which pixels drove the prediction of `target` for a single image.
+
+        The occlusion map blanks every `patch`x`patch` window (with `stride`) and
+        scores all occluded variants in one batched forward pass; each pixel gets
+        the mean probability drop of the windows covering it. The gradient map is
+        the absolute input gradient of the target log-probability, from a single
+        backward pass.
+
+        Args:
+            image (torch.Tensor): A [1, 28, 28] grayscale image (values in -1–1).
+            target (int): The class label to explain (usually the prediction).
+
+        Returns:
+            list: Occlusion and gradient saliency visuals, in the same format as the model visuals.
+        """
+        try:
+            if image.ndim == 2:
+                image = image.unsqueeze(0)
+            image = image.unsqueeze(0).to(self.device).float() # [1, 1, H, W]
+            height, width = image.shape[-2:]
+
+            # Masks of all occlusion windows at once → [K, 1, H, W]
+            rows = torch.arange(height, device=self.device)
+            cols = torch.arange(width, device=self.device)
+            tops = torch.arange(0, height - patch + 1, stride, device=self.device)
+            lefts = torch.arange(0, width - patch + 1, stride, device=self.device)
+            row_masks = (rows[None, :] >= tops[:, None]) & (rows[None, :] < tops[:, None] + patch)
+            col_masks = (cols[None, :] >= lefts[:, None]) & (cols[None, :] < lefts[:, None] + patch)
+            masks = (row_masks[:, None, :, None] & col_masks[None, :, None, :]).reshape(-1, 1, height, width)
+
+            # Occlude with the canvas background (black, i.e. -1 after normalization)
+            occluded = torch.where(masks, torch.full_like(image, -1.0), image)
+
+            with torch.no_grad():
+                base = torch.exp(self.model(image, save_visuals=False))[0, target]
+                probabilities = torch.exp(self.model(occluded, save_visuals=False))[:, target]
+
+            drops = (base - probabilities).clamp(min=0)
+            masks = masks.float()
+            occlusion = (masks * drops[:, None, None, None]).sum(dim=0) / masks.sum(dim=0).clamp(min=1)
+
+            with torch.enable_grad():
+                inputs = image.clone().requires_grad_(True)
+                output = self.model(inputs, save_visuals=False)
+                gradient, = torch.autograd.grad(output[0, target], inputs)
+
+            return [
+                self.model.prepare_visuals("Occlusion Saliency", occlusion[0].cpu().numpy()),
+                self.model.prepare_visuals("Gradient Saliency", gradient[0, 0].abs().cpu().numpy()),
+            ]
+
+        except Exception as e:
+            print(Fore.RED, f"Error computing saliency: {e}", Style.RESET_ALL)
+            return []
         
+    #==========================#
+    def data_to_bitmap(self, data: bytes) -> np.ndarray:
+        """
+        Decode image bytes into the normalized grayscale bitmap the model consumes.
+
+        Args:
+            data (bytes): Byte data of an encoded image (e.g. the canvas PNG).
+
+        Returns:
+            np.ndarray: A [28, 28] uint8 array, or None if the data could not be decoded.
+        """
+        try:
+            image = Image.open(io.BytesIO(data)).convert('L')  # Convert to grayscale
+            image = image.resize((28, 28), Image.BILINEAR)    # Same filter as transforms.Resize
+            return np.asarray(image, dtype=np.uint8)
+
+        except Exception as e:
+            print(Fore.RED, f"Error converting data to bitmap: {e}", Style.RESET_ALL)
+            return None
+
+    #==========================#
+    def bitmap_to_tensor(self, bitmap: np.ndarray) -> torch.Tensor:
+        """
+        Convert a [28, 28] uint8 bitmap (or a [N, 28, 28] stack of them) to a PyTorch tensor.
+
+        Args:
+            bitmap (np.ndarray): A [28, 28] uint8 grayscale bitmap.
+
+        Returns:
+            torch.Tensor: A [1, 28, 28] (or [N, 1, 28, 28]) tensor with values in [-1, 1].
+        """
+        tensor = torch.from_numpy(np.array(bitmap, dtype=np.float32))
+        tensor = tensor.unsqueeze(0) if tensor.ndim == 2 else tensor.unsqueeze(1)
+        return tensor.div_(255.0).sub_(0.5).div_(0.5) # Convert to [-1, 1]
+
     #==========================#
     async def data_to_tensor(self, data: bytes) -> torch.Tensor:
         """
@@ -70,19 +253,10 @@ class LeNetLoader:
         Returns:
             torch.Tensor: A [1, 28, 28] tensor representing the image.
         """
-        try:
-            image = Image.open(io.BytesIO(data)).convert('L')  # Convert to grayscale
-            transform = transforms.Compose([
-                transforms.Resize((28, 28)),  # Resize to 28x28
-                transforms.ToTensor(),        # Convert to tensor
-                transforms.Normalize((0.5,), (0.5,)) # Convert to [-1, 1]
-            ])
-            tensor = transform(image)
-            return tensor
-        
-        except Exception as e:
-            print(Fore.RED, f"Error converting data to tensor: {e}", Style.RESET_ALL)
+        bitmap = self.data_to_bitmap(data)
+        if bitmap is None:
             return None
+        return self.bitmap_to_tensor(bitmap)
     
 #==========================#
 class LeNet(nn.Module):
@@ -104,6 +278,17 @@ class LeNet(nn.Module):
         self.fc2 = nn.Linear(120, 84)
         self.fc3 = nn.Linear(84, 10)
 
+        # Visuals are per thread so concurrent inference workers each read their own
+        self._local = threading.local()
+
+    @property
+    def visuals(self):
+        return getattr(self._local, "visuals", [])
+
+    @visuals.setter
+    def visuals(self, value):
+        self._local.visuals = value
+
     def _init_fc1(self):
         with torch.no_grad():
             dummy_input = torch.zeros(1, self.in_channels, *self.input_size)
@@ -121,7 +306,6 @@ class LeNet(nn.Module):
         Returns:
             torch.Tensor: Output tensor after passing through the network.
         """
-        self.visuals = []
         visuals = []
 
         if save_visuals:
@@ -171,7 +355,9 @@ class LeNet(nn.Module):
             visuals.append(self.prepare_visuals("FC3 Output (10 logits)", fc3_vis, 10, 1))
             visuals.append(self.prepare_final_predictions("FC3 Output (10 probabilities) in percentage", fc3_vis))
 
-        self.visuals = visuals
+            # Only visual passes publish their visuals, so batched passes run
+            # alongside live predictions do not clobber them
+            self.visuals = visuals
 
         return out
 
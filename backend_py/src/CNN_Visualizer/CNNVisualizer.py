@@ -1,13 +1,44 @@
-from Application.application import MyServer
+from Application.application import MyServer, ClosingStreamingResponse
 from CNN_Visualizer.CNNModelHolder import LeNetLoader
-from Helpers.ThreadPools import run_in_executor
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from CNN_Visualizer.BulkEvaluator import BulkEvaluator, load_npy
+from CNN_Visualizer.StrokeRasterizer import parse_strokes, rasterize_strokes, MAX_POINTS
+from Helpers.ThreadPools import run_in_executor, run_in_inference_executor, run_in_preprocess_executor, run_in_bulk_executor, configure_torch_threads
+from Config.config import IMAGE_STORE_ORIGINALS
+from Config.config import PREDICT_BATCH_SIZE, PREDICT_MAX_IMAGES, PREDICT_MAX_BYTES, PREDICT_MAX_CONCURRENT
+from Config.config import ATLAS_CACHE_SIZE, ATLAS_CACHE_BYTES
+from Helpers.Caches import LRUCache
+from Helpers.Images import pack_atlas
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, HTTPException
+from starlette.formparsers import MultiPartParser, MultiPartException
+from fastapi.requests import Request
+from fastapi.responses import JSONResponse, Response
 from datetime import datetime
+import numpy as np
+import asyncio
 import base64
+import hashlib
+import io
 import os
 from colorama import Fore, Style
 import json
 
+MODELS_DIR = "other/Models"
+
+# Binary /api/predict record: int8 prediction (-1 if the image could not be
+# decoded) followed by the 10 class probabilities as little-endian float32
+PREDICTION_RECORD = np.dtype([("prediction", "i1"), ("probabilities", "<f4", (10,))])
+
+ATLAS_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+# Feature maps as visuals lists, or packed in a PNG / WebP atlas
+OUTPUT_MODES = ("visuals", "atlas", "atlas-webp")
+
+#==========================#
+def parse_output_mode(output) -> str:
+    if not isinstance(output, str) or output not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode {output!r}, expected one of {OUTPUT_MODES}")
+    return output
+
 #==========================#
 class CNNServer(MyServer):
 
@@ -15,12 +46,24 @@ class CNNServer(MyServer):
     def __init__(self, port: int = 5000):
         super().__init__(port=port)
 
+        configure_torch_threads()
+
         self.images = {}
         self.image_filepaths = {}
-        self.modelHolder = LeNetLoader(model_path="other/Models/mnist_leNet.pth", dataset="mnist")
+        self.strokes = {}
+        self.atlas_cache = LRUCache(max_items=ATLAS_CACHE_SIZE, max_bytes=ATLAS_CACHE_BYTES)
+        self.modelHolder = LeNetLoader(model_path=os.path.join(MODELS_DIR, "mnist_leNet.pth"), dataset="mnist")
 
         self.modelHolder.load_model()
 
+        self.reevaluation_lock = asyncio.Lock()
+        self.predict_semaphore = asyncio.Semaphore(PREDICT_MAX_CONCURRENT)
+        self.add_api_route("/api/admin/reevaluate", self.reevaluate_handler, methods=["POST"])
+        self.add_api_route("/api/predict", self.predict_handler, methods=["POST"])
+        self.add_api_route("/api/atlas/{name}", self.atlas_handler, methods=["GET"])
+        self.add_api_route("/api/model", self.model_handler, methods=["GET"])
+        self.add_api_route("/api/model/{version}/static", self.static_visuals_handler, methods=["GET"])
+
     #==========================#
     async def process_message(self, type: str, data: str, websocket: WebSocket):
         
@@ -40,7 +83,23 @@ class CNNServer(MyServer):
                 if "data" not in data or "name" not in data or "real" not in data:
                     print(Fore.RED, "Invalid MNIST image message received. Missing keys in data: ", data, " from ", websocket.client.port, Style.RESET_ALL)
                     return
-                await self.handle_mnist_image(data['data'], websocket, data['real'], data['name'])
+                try:
+                    output = parse_output_mode(data.get('output', 'visuals'))
+                except ValueError as e:
+                    print(Fore.RED, f"Invalid MNIST image message from {websocket.client.port}: {e}", Style.RESET_ALL)
+                    await self.sendMessage(websocket, "mnist-prediction-error", "error")
+                    return
+                await self.handle_mnist_image(data['data'], websocket, data['real'], data['name'], bool(data.get('saliency', False)), output)
+                pass
+            case "mnist-strokes":
+                # Compact enough to be sent as a plain object, but accept JSON text like mnist-image
+                if isinstance(data, str):
+                    data = json.loads(data)
+
+                if "strokes" not in data or "width" not in data:
+                    print(Fore.RED, "Invalid MNIST strokes message received. Missing keys in data: ", data, " from ", websocket.client.port, Style.RESET_ALL)
+                    return
+                await self.handle_mnist_strokes(data, websocket)
                 pass
             case _:
                 # Default case
@@ -48,7 +107,7 @@ class CNNServer(MyServer):
                 pass
     
     #==========================#
-    async def handle_mnist_image(self, data: str, websocket: WebSocket, real: int = -1, client_name: str = ""):
+    async def handle_mnist_image(self, data: str, websocket: WebSocket, real: int = -1, client_name: str = "", saliency: bool = False, output: str = "visuals"):
         # Handle the MNIST image data here        
         image_data = base64.b64decode(data)
         os.makedirs("mnist_images", exist_ok=True)
@@ -63,16 +122,75 @@ class CNNServer(MyServer):
         #with open(filepath, "wb") as image_file:
         #   image_file.write(image_data)
 
-        self.images[websocket] = image_data
+        if self.connections.track(websocket, "image", len(image_data)):
+            self.images[websocket] = image_data
+        else:
+            self.images.pop(websocket, None) # Over the session budget, predict without keeping it
         #self.image_filepaths[websocket] = filepath
         
         await self.sendMessage(websocket, "mnist-image", data)
 
         # Perform inference
-        image_tensor = await self.modelHolder.data_to_tensor(image_data)
+        bitmap = await run_in_preprocess_executor(self.modelHolder.data_to_bitmap, image_data)
+        if bitmap is None:
+            await self.sendMessage(websocket, "mnist-prediction-error", "error")
+            return
+
+        await self.predict_and_send(
+            websocket,
+            bitmap,
+            real,
+            client_name,
+            saliency,
+            output,
+            original=image_data if IMAGE_STORE_ORIGINALS else None
+        )
+
+    #==========================#
+    async def handle_mnist_strokes(self, data: dict, websocket: WebSocket):
+        """
+        Predict from pen strokes rasterized server-side. With "append", the
+        strokes extend the session's previous drawing on the same canvas size.
+        """
+        try:
+            width = float(data["width"])
+            height = float(data.get("height", width))
+            line_width = data.get("lineWidth")
+            line_width = None if line_width is None else float(line_width)
+            strokes = parse_strokes(data["strokes"])
+            real = int(data.get("real", -1))
+            client_name = str(data.get("name", ""))
+            saliency = bool(data.get("saliency", False))
+            output = parse_output_mode(data.get("output", "visuals"))
+
+            previous = self.strokes.get(websocket)
+            if data.get("append", False) and previous is not None and previous["size"] == (width, height):
+                strokes = previous["strokes"] + strokes
+                line_width = previous["line_width"] if line_width is None else line_width
+                if sum(len(stroke) for stroke in strokes) > MAX_POINTS:
+                    raise ValueError(f"Too many stroke points (more than {MAX_POINTS})")
+
+            bitmap = await run_in_preprocess_executor(rasterize_strokes, strokes, width, height, line_width)
+
+        except (TypeError, ValueError) as e:
+            print(Fore.RED, f"Invalid strokes from {websocket.client.port}: {e}", Style.RESET_ALL)
+            await self.sendMessage(websocket, "mnist-prediction-error", "error")
+            return
+
+        # Only a drawing that could be rasterized is kept for "append"
+        if self.connections.track(websocket, "strokes", sum(stroke.nbytes for stroke in strokes)):
+            self.strokes[websocket] = {"size": (width, height), "line_width": line_width, "strokes": strokes}
+        else:
+            self.strokes.pop(websocket, None) # Too large to keep for "append"
+
+        await self.predict_and_send(websocket, bitmap, real, client_name, saliency, output)
+
+    #==========================#
+    async def predict_and_send(self, websocket: WebSocket, bitmap, real: int = -1, client_name: str = "", saliency: bool = False, output: str = "visuals", original: bytes = None):
+        image_tensor = self.modelHolder.bitmap_to_tensor(bitmap)
 
         # Thread pool for prediction
-        prediction, visuals = await run_in_executor(self.modelHolder.predict, image_tensor)
+        prediction, visuals = await run_in_inference_executor(self.modelHolder.predict, image_tensor)
 
         print(Fore.GREEN, f"Prediction for image from {websocket.client.port}: {prediction}", Style.RESET_ALL)
 
@@ -81,7 +199,16 @@ class CNNServer(MyServer):
                 print(Fore.RED, f"Error during prediction for image from {websocket.client.port}", Style.RESET_ALL)
                 await self.sendMessage(websocket, "mnist-prediction-error", "error")
             case _:
-                await self.package_and_send_prediction(websocket, prediction, visuals)
+                saliency_visuals = None
+                if saliency:
+                    saliency_visuals = await run_in_inference_executor(self.modelHolder.saliency, image_tensor, prediction)
+
+                # "atlas" or "atlas-webp": feature maps as one cached sprite image
+                atlas = None
+                if output.startswith("atlas"):
+                    atlas = await self.build_atlas(visuals[:-1], "webp" if output == "atlas-webp" else "png")
+
+                await self.package_and_send_prediction(websocket, prediction, visuals, saliency_visuals, atlas)
         
         if real != -1:
 
@@ -91,13 +218,36 @@ class CNNServer(MyServer):
                 client_name = f"Client {websocket.client.port}"
             # Save the image to the file system
             await self.db.insert_and_cleanup_image(
-                image_data=image_data,
+                bitmap=bitmap.tobytes(),
                 prediction=prediction,
                 real=real,  # Placeholder for the real label
                 client_port=websocket.client.port,
-                client_name=client_name
+                client_name=client_name,
+                original=original
             )
 
+    #==========================#
+    async def build_atlas(self, visuals: list, image_format: str = "png") -> dict:
+        """
+        Pack the feature maps into one atlas image, cached under its content hash.
+
+        Returns:
+            dict: The atlas url, size and the layout of every feature map in it.
+        """
+        data, width, height, layout = await run_in_preprocess_executor(pack_atlas, visuals, image_format)
+
+        name = f"{hashlib.sha256(data).hexdigest()[:32]}.{image_format}"
+        if name not in self.atlas_cache:
+            self.atlas_cache.put(name, data)
+
+        return {
+            "url": f"/api/atlas/{name}",
+            "format": image_format,
+            "width": width,
+            "height": height,
+            "layout": layout,
+        }
+
     #==========================#
     async def on_connect(self, websocket: WebSocket):
         print(Fore.GREEN, f"Client {websocket.client.port} connected at {datetime.now()}", Style.RESET_ALL)
@@ -106,15 +256,26 @@ class CNNServer(MyServer):
     async def on_disconnect(self, websocket: WebSocket):
         print(Fore.YELLOW, f"Client {websocket.client.port} disconnected at {datetime.now()}", Style.RESET_ALL)
 
-        if websocket in self.images:
-            del self.images[websocket]
+        self.release_session_state(websocket, "image")
+        self.release_session_state(websocket, "strokes")
 
         if websocket in self.image_filepaths:
-            os.remove(self.image_filepaths[websocket])
-            del self.image_filepaths[websocket]
+            filepath = self.image_filepaths.pop(websocket)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    #==========================#
+    def release_session_state(self, websocket: WebSocket, key: str):
+        if key == "image":
+            self.images.pop(websocket, None)
+        elif key == "strokes":
+            self.strokes.pop(websocket, None)
 
     #==========================#
-    async def package_and_send_prediction(self, websocket: WebSocket, prediction: int, visuals: list):
+    async def package_and_send_prediction(self, websocket: WebSocket, prediction: int, visuals: list, saliency: list = None, atlas: dict = None):
+        if atlas is not None:
+            visuals = visuals[-1:] # The feature maps are in the atlas, keep the probabilities
+
         for index, visual in enumerate(visuals):
             if index == len(visuals) - 1:
                 continue
@@ -122,7 +283,203 @@ class CNNServer(MyServer):
 
         payload = {
             "prediction": prediction,
+            "model_version": self.modelHolder.model_version,
             "visuals": visuals
         }
 
-        await self.sendMessage(websocket, "mnist-prediction", json.dumps(payload))
\ No newline at end of file
+        # Kept out of `visuals`, whose last entry must stay the FC3 probabilities
+        if saliency is not None:
+            payload["saliency"] = saliency
+
+        if atlas is not None:
+            payload["atlas"] = atlas
+
+        await self.sendMessage(websocket, "mnist-prediction", json.dumps(payload))
+
+    #==========================#
+    async def reevaluate_handler(self, request: Request, checkpoint: str = Query(default="")):
+        self.require_admin(request)
+
+        if self.reevaluation_lock.locked():
+            return JSONResponse(content={"message": "A re-evaluation is already running."}, status_code=409)
+
+        async with self.reevaluation_lock:
+            model_holder = self.modelHolder
+            if checkpoint:
+                # Only checkpoints shipped in the models folder can be evaluated
+                model_holder = LeNetLoader(model_path=os.path.join(MODELS_DIR, os.path.basename(checkpoint)), dataset="mnist")
+                if not await run_in_executor(model_holder.load_model):
+                    return JSONResponse(content={"message": f"Could not load checkpoint {checkpoint}."}, status_code=404)
+
+            report = await BulkEvaluator(model_holder).evaluate_database(self.db)
+
+        report["checkpoint"] = os.path.basename(model_holder.model_path)
+        return JSONResponse(content=report)
+
+    #==========================#
+    async def model_handler(self):
+        version = self.modelHolder.model_version
+        if version is None:
+            return JSONResponse(content={"message": "No model loaded."}, status_code=503)
+
+        return JSONResponse(
+            content={"version": version, "static_visuals": f"/api/model/{version}/static"},
+            headers={"Cache-Control": "no-cache"}
+        )
+
+    #==========================#
+    async def static_visuals_handler(self, version: str, request: Request):
+        if version != self.modelHolder.model_version:
+            return JSONResponse(content={"message": f"Unknown model version {version}."}, status_code=404)
+
+        # The blob never changes for a given version, so clients fetch it once per model
+        headers = {
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{version}"',
+        }
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=self.modelHolder.static_visuals, media_type="application/octet-stream", headers=headers)
+
+    #==========================#
+    async def predict_handler(self, request: Request):
+        """
+        Batch prediction without visuals. Accepts multipart PNG uploads, a raw
+        N x 28 x 28 uint8 body (application/octet-stream) or a .npy array
+        (application/x-npy). Results stream back batch by batch, as JSON or,
+        with `Accept: application/octet-stream`, as PREDICTION_RECORD records.
+
+        At most PREDICT_MAX_CONCURRENT requests run at once, all of them on the
+        bulk executor, so batch callers never take the websocket inference workers.
+        """
+        if self.predict_semaphore.locked():
+            return JSONResponse(content={"message": "Too many batch predictions running, retry later."}, status_code=429)
+
+        await self.predict_semaphore.acquire()
+        try:
+            images = await self.read_prediction_images(request)
+        except BaseException:
+            self.predict_semaphore.release()
+            raise
+
+        binary = "application/octet-stream" in request.headers.get("accept", "")
+        headers = {"X-Image-Count": str(len(images))}
+
+        async def stream():
+            if not binary:
+                yield b'{"results":['
+
+            for start in range(0, len(images), PREDICT_BATCH_SIZE):
+                records = await run_in_bulk_executor(self.predict_records, images[start:start + PREDICT_BATCH_SIZE])
+
+                if binary:
+                    yield records.tobytes()
+                    continue
+
+                results = b",".join(json.dumps({
+                    "prediction": int(record["prediction"]),
+                    "probabilities": np.round(record["probabilities"].astype(np.float64), 5).tolist()
+                }).encode("utf-8") for record in records)
+                yield (b"," if start else b"") + results
+
+            if not binary:
+                yield b"]}"
+
+        async def release():
+            self.predict_semaphore.release()
+
+        media_type = "application/octet-stream" if binary else "application/json"
+        return ClosingStreamingResponse(stream(), on_close=release, media_type=media_type, headers=headers)
+
+    #==========================#
+    async def read_prediction_images(self, request: Request):
+        """
+        Read and decode the body of a batch prediction request, at most PREDICT_MAX_BYTES
+        whether or not a Content-Length was sent.
+
+        Returns:
+            list | np.ndarray: Encoded images (list of bytes) or a [N, 28, 28] uint8 array.
+        """
+        try:
+            declared = int(request.headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Malformed Content-Length header.")
+        if declared > PREDICT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body larger than {PREDICT_MAX_BYTES} bytes.")
+
+        chunks, received = [], 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > PREDICT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"Body larger than {PREDICT_MAX_BYTES} bytes.")
+            chunks.append(chunk)
+        body = b"".join(chunks)
+
+        content_type = request.headers.get("content-type", "application/octet-stream").split(";")[0].strip()
+
+        try:
+            match content_type:
+                case "multipart/form-data":
+                    async def body_stream():
+                        yield body
+
+                    parser = MultiPartParser(request.headers, body_stream(), max_files=PREDICT_MAX_IMAGES)
+                    form = await parser.parse()
+                    try:
+                        images = [await value.read() for _, value in form.multi_items() if hasattr(value, "read")]
+                    finally:
+                        await form.close()
+                case "application/x-npy" | "application/npy":
+                    images = load_npy(io.BytesIO(body))
+                case "application/octet-stream":
+                    if len(body) % (28 * 28) != 0:
+                        raise ValueError("Raw body must be N x 28 x 28 uint8 pixels")
+                    images = np.frombuffer(body, dtype=np.uint8).reshape(-1, 28, 28)
+                case _:
+                    raise HTTPException(status_code=415, detail=f"Unsupported content type {content_type}.")
+        except (MultiPartException, ValueError, EOFError, OSError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid images: {e}")
+
+        if len(images) == 0:
+            raise HTTPException(status_code=400, detail="No images received.")
+        if len(images) > PREDICT_MAX_IMAGES:
+            raise HTTPException(status_code=413, detail=f"At most {PREDICT_MAX_IMAGES} images per request.")
+
+        return images
+
+    #==========================#
+    def predict_records(self, images) -> np.ndarray:
+        """
+        Predict one batch of encoded images (list of bytes) or bitmaps ([N, 28, 28] uint8).
+        """
+        if isinstance(images, list):
+            bitmaps = [self.modelHolder.data_to_bitmap(image) for image in images]
+            valid = np.array([bitmap is not None for bitmap in bitmaps])
+            images = np.stack([bitmap if bitmap is not None else np.zeros((28, 28), dtype=np.uint8) for bitmap in bitmaps])
+        else:
+            valid = np.ones(len(images), dtype=bool)
+
+        tensor = self.modelHolder.bitmap_to_tensor(images)
+        predictions, probabilities = self.modelHolder.predict_batch(tensor)
+
+        records = np.zeros(len(images), dtype=PREDICTION_RECORD)
+        records["prediction"] = np.where(valid, predictions, -1)
+        records["probabilities"] = np.where(valid[:, None], probabilities, 0.0)
+        return records
+
+    #==========================#
+    async def atlas_handler(self, name: str, request: Request):
+        data = self.atlas_cache.get(name)
+        if data is None:
+            return JSONResponse(content={"message": "Atlas not found."}, status_code=404)
+
+        # Content-addressed, so the bytes behind a name never change
+        headers = {
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{name}"',
+        }
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=data, media_type=ATLAS_MEDIA_TYPES[name.rsplit(".", 1)[-1]], headers=headers)
@@ -0,0 +1,133 @@
+from PIL import Image
+import numpy as np
+
+# The drawing canvas strokes with lineWidth = 6% of its size and round caps
+DEFAULT_LINE_WIDTH_RATIO = 0.06
+MAX_LINE_WIDTH_RATIO = 0.12
+MAX_POINTS = 4000
+CHUNK_PIECES = 1024
+
+# Upper bound on the pixel tests of one drawing (pieces x window pixels, about
+# 25 ns each), so a single message cannot hold a preprocessing worker for long.
+# A digit drawn on the frontend canvas needs well under 100k.
+MAX_WORK = 2_000_000
+
+#==========================#
+def parse_strokes(strokes: list) -> list:
+    """
+    Convert strokes given as flat [x0, y0, x1, y1, ...] lists (or lists of
+    [x, y] pairs) into [K, 2] float32 arrays, dropping empty strokes.
+    """
+    parsed = []
+    total = 0
+    for stroke in strokes:
+        points = np.asarray(stroke, dtype=np.float32).reshape(-1)
+        points = points[:len(points) // 2 * 2].reshape(-1, 2)
+        if len(points) == 0:
+            continue
+        if not np.isfinite(points).all():
+            raise ValueError("Stroke points must be finite numbers")
+        total += len(points)
+        if total > MAX_POINTS:
+            raise ValueError(f"Too many stroke points (more than {MAX_POINTS})")
+        parsed.append(points)
+    return parsed
+
+#==========================#
+def rasterize_strokes(
+    strokes: list,
+    width: float,
+    height: float,
+    line_width: float = None,
+    size: int = 28,
+    supersample: int = 4,
+) -> np.ndarray:
+    """
+    Rasterize pen strokes straight into the model's input bitmap.
+
+    Strokes are drawn white on black as round-capped lines, like the frontend
+    canvas, at `supersample` times the output resolution. The result is then
+    reduced with the same bilinear filter `LeNetLoader.data_to_bitmap` applies
+    to canvas PNGs, whose footprint in output pixels does not depend on the
+    source resolution. Drawings over the MAX_WORK budget raise a ValueError.
+
+    Args:
+        strokes (list): [K, 2] float arrays of canvas coordinates, as returned by parse_strokes.
+        width (float): Canvas width the coordinates refer to.
+        height (float): Canvas height the coordinates refer to.
+        line_width (float): Stroke width in canvas units (defaults to 6% of the canvas, at most 12%).
+
+    Returns:
+        np.ndarray: A [size, size] uint8 bitmap.
+    """
+    if not (np.isfinite(width) and np.isfinite(height) and width > 0 and height > 0):
+        raise ValueError(f"Invalid canvas size {width}x{height}")
+
+    if line_width is None:
+        line_width = DEFAULT_LINE_WIDTH_RATIO * min(width, height)
+    line_width = float(np.clip(line_width, 0.0, MAX_LINE_WIDTH_RATIO * min(width, height)))
+
+    grid = size * supersample
+    coverage = np.zeros(grid * grid, dtype=bool)
+
+    segments = [np.concatenate([points[:-1], points[1:]], axis=1) if len(points) > 1 else np.concatenate([points, points], axis=1) for points in strokes]
+    if segments:
+        segments = np.concatenate(segments) # [S, 4]: x0, y0, x1, y1
+
+        # Points far off the canvas would only make long invisible segments
+        margin = line_width
+        segments[:, 0::2] = np.clip(segments[:, 0::2], -margin, width + margin)
+        segments[:, 1::2] = np.clip(segments[:, 1::2], -margin, height + margin)
+
+        # Work in supersampled pixel units
+        scale = np.array([grid / width, grid / height, grid / width, grid / height], dtype=np.float32)
+        segments = segments * scale
+        radius = line_width / 2 * grid / max(width, height)
+
+        # Split segments into pieces of at most `piece` pixels, so every piece
+        # only touches a fixed window of window x window pixels around it
+        piece = 4.0
+        lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+        counts = np.maximum(np.ceil(lengths / piece), 1).astype(np.int64)
+
+        window = int(np.ceil(piece + 2 * radius)) + 2
+        if int(counts.sum()) * window * window > MAX_WORK:
+            raise ValueError("Strokes are too long to rasterize")
+
+        owners = np.repeat(np.arange(len(segments)), counts)
+        index = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        t0 = (index / counts[owners])[:, None]
+        t1 = ((index + 1) / counts[owners])[:, None]
+        start, end = segments[owners, :2], segments[owners, 2:]
+        a = start + (end - start) * t0 # [P, 2]
+        d = (end - start) * (t1 - t0)  # [P, 2]
+
+        offsets = np.arange(window)
+
+        for first in range(0, len(a), CHUNK_PIECES):
+            _cover_pieces(coverage, grid, a[first:first + CHUNK_PIECES], d[first:first + CHUNK_PIECES], radius, offsets)
+
+    image = Image.fromarray((coverage.reshape(grid, grid) * 255).astype(np.uint8))
+    return np.asarray(image.resize((size, size), Image.BILINEAR), dtype=np.uint8)
+
+#==========================#
+def _cover_pieces(coverage: np.ndarray, grid: int, a: np.ndarray, d: np.ndarray, radius: float, offsets: np.ndarray):
+    """
+    Mark the pixels within `radius` of the pieces a + t * d (t in [0, 1]), each
+    piece only looking at the window of pixels around it.
+    """
+    origin = np.floor(np.minimum(a, a + d) - radius).astype(np.int64) # [P, 2]
+    xs = origin[:, 0, None, None] + offsets[None, None, :] # [P, 1, W]
+    ys = origin[:, 1, None, None] + offsets[None, :, None] # [P, W, 1]
+
+    # Distance from each window pixel center to its piece
+    dx = xs + 0.5 - a[:, 0, None, None]
+    dy = ys + 0.5 - a[:, 1, None, None]
+    length2 = np.maximum((d * d).sum(axis=1), 1e-12)[:, None, None]
+    t = np.clip((dx * d[:, 0, None, None] + dy * d[:, 1, None, None]) / length2, 0.0, 1.0)
+    dx = dx - t * d[:, 0, None, None]
+    dy = dy - t * d[:, 1, None, None]
+
+    mask = (dx * dx + dy * dy <= radius * radius) & (xs >= 0) & (xs < grid) & (ys >= 0) & (ys < grid)
+    pixels = np.broadcast_to(ys * grid + xs, mask.shape)
+    coverage[pixels[mask]] = True
@@ -17,6 +17,54 @@ BACKEND_WS_URL = os.getenv("BACKEND_WS_URL", f"ws://localhost:{BACKEND_PORT}/ws"
 BACKEND_API_URL = os.getenv("BACKEND_API_URL", f"http://localhost:{BACKEND_PORT}")
 
 BACKEND_PROXY_HEADERS = int(os.getenv("BACKEND_PROXY_HEADERS", 0)) > 0
+# Comma-separated proxy addresses trusted for X-Forwarded-For (uvicorn's default is 127.0.0.1)
+BACKEND_FORWARDED_ALLOW_IPS = os.getenv("BACKEND_FORWARDED_ALLOW_IPS", "")
 
 BACKEND_EMAIL = os.getenv("PRIVATE_EMAIL", "")
-BACKEND_EMAIL_PASSWORD = os.getenv("PRIVATE_EMAIL_PASSWORD", "")
\ No newline at end of file
+BACKEND_EMAIL_PASSWORD = os.getenv("PRIVATE_EMAIL_PASSWORD", "")
+
+# Admin endpoints are disabled unless a token is configured
+BACKEND_ADMIN_TOKEN = os.getenv("BACKEND_ADMIN_TOKEN", "")
+
+# Thread budget (0 = derived from the available cores and cgroup CPU quota)
+THREADS_INFERENCE_WORKERS = int(os.getenv("THREADS_INFERENCE_WORKERS", 0))
+THREADS_TORCH = int(os.getenv("THREADS_TORCH", 0))
+THREADS_PREPROCESS_WORKERS = int(os.getenv("THREADS_PREPROCESS_WORKERS", 0))
+THREADS_IO_WORKERS = int(os.getenv("THREADS_IO_WORKERS", 0))
+
+# Websocket traffic capture (disabled unless a path is set)
+CAPTURE_PATH = os.getenv("CAPTURE_PATH", "")
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", 1.0))
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", 1 << 30))
+
+# HTTP batch prediction limits
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", 256))
+PREDICT_MAX_IMAGES = int(os.getenv("PREDICT_MAX_IMAGES", 20000))
+PREDICT_MAX_BYTES = int(os.getenv("PREDICT_MAX_BYTES", 64 * 1024 * 1024))
+PREDICT_MAX_CONCURRENT = int(os.getenv("PREDICT_MAX_CONCURRENT", 2))
+
+STATS_PERSIST_INTERVAL = float(os.getenv("STATS_PERSIST_INTERVAL", 30))
+
+# Concurrent /api/last_connections streams, each holding a pooled connection, and their stall timeout
+DB_MAX_STREAMS = int(os.getenv("DB_MAX_STREAMS", 2))
+DB_STREAM_TIMEOUT = float(os.getenv("DB_STREAM_TIMEOUT", 30))
+
+IMAGE_STORE_ORIGINALS = int(os.getenv("IMAGE_STORE_ORIGINALS", 0)) > 0
+IMAGE_PNG_CACHE_SIZE = int(os.getenv("IMAGE_PNG_CACHE_SIZE", 4096))
+
+ATLAS_CACHE_SIZE = int(os.getenv("ATLAS_CACHE_SIZE", 2048))
+ATLAS_CACHE_BYTES = int(os.getenv("ATLAS_CACHE_BYTES", 32 * 1024 * 1024))
+
+# Websocket connection limits (0 = unlimited)
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", 1000))
+# Behind a proxy, every client has the proxy's address unless BACKEND_PROXY_HEADERS
+# is set and the proxy is in BACKEND_FORWARDED_ALLOW_IPS; only enable this then.
+WS_MAX_CONNECTIONS_PER_IP = int(os.getenv("WS_MAX_CONNECTIONS_PER_IP", 0))
+# The frontend connects once and never reconnects, so only set this for clients
+# that reconnect or send {"type": "ping"}. Dead peers are dropped by the pings below.
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", 0))
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", 20))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", 20))
+WS_MAX_MESSAGE_BYTES = int(os.getenv("WS_MAX_MESSAGE_BYTES", 4 * 1024 * 1024))
+WS_SESSION_MEMORY_BUDGET = int(os.getenv("WS_SESSION_MEMORY_BUDGET", 4 * 1024 * 1024))
+WS_TOTAL_MEMORY_BUDGET = int(os.getenv("WS_TOTAL_MEMORY_BUDGET", 256 * 1024 * 1024))
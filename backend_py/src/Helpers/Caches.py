@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+#==========================#
+class LRUCache:
+    """
+    Small least-recently-used cache for immutable byte payloads, bounded both by
+    number of entries and by the total size of the cached values.
+    """
+
+    def __init__(self, max_items: int = 1024, max_bytes: int = 16 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    #==========================#
+    def get(self, key: Hashable) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    #==========================#
+    def put(self, key: Hashable, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size_bytes -= len(previous)
+
+        self._entries[key] = value
+        self.size_bytes += len(value)
+
+        while len(self._entries) > self.max_items or self.size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= len(evicted)
+
+    #==========================#
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    #==========================#
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,53 @@
+from PIL import Image
+import numpy as np
+import io
+
+MNIST_SIZE = (28, 28)
+
+#==========================#
+def bitmap_to_png(bitmap: bytes, size: tuple = MNIST_SIZE) -> bytes:
+    """
+    Encode a raw uint8 grayscale bitmap (row-major, 28x28 by default) as a PNG.
+    """
+    array = np.frombuffer(bitmap, dtype=np.uint8).reshape(size[1], size[0])
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+#==========================#
+def pack_atlas(visuals: list, image_format: str = "png", padding: int = 1):
+    """
+    Pack uint8 visuals ({"title", "width", "height", "data"}) into one grayscale
+    sprite atlas with a simple shelf packer, tallest visuals first.
+
+    Returns:
+        tuple: (encoded atlas bytes, atlas width, atlas height, layout list with
+        the title, x, y, width and height of every visual, in input order)
+    """
+    sizes = [(int(visual["width"]), int(visual["height"])) for visual in visuals]
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    atlas_width = max(max(w for w, _ in sizes) + padding, int(np.ceil(np.sqrt(area))))
+
+    layout = [None] * len(visuals)
+    x = y = shelf_height = 0
+    for index in sorted(range(len(visuals)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[index]
+        if x + w > atlas_width:
+            x, y, shelf_height = 0, y + shelf_height + padding, 0
+        layout[index] = {"title": visuals[index]["title"], "x": x, "y": y, "width": w, "height": h}
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+    atlas_height = y + shelf_height
+
+    atlas = np.zeros((atlas_height, atlas_width), dtype=np.uint8)
+    for visual, entry in zip(visuals, layout):
+        pixels = np.asarray(visual["data"], dtype=np.uint8).reshape(entry["height"], entry["width"])
+        atlas[entry["y"]:entry["y"] + entry["height"], entry["x"]:entry["x"] + entry["width"]] = pixels
+
+    buffer = io.BytesIO()
+    if image_format == "webp":
+        Image.fromarray(atlas).save(buffer, format="WEBP", lossless=True, method=2)
+    else:
+        Image.fromarray(atlas).save(buffer, format="PNG")
+
+    return buffer.getvalue(), atlas_width, atlas_height, layout
@@ -1,8 +1,120 @@
 import asyncio
+import math
+import os
+import sys
 from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from Config.config import THREADS_INFERENCE_WORKERS
+from Config.config import THREADS_TORCH
+from Config.config import THREADS_PREPROCESS_WORKERS
+from Config.config import THREADS_IO_WORKERS
 
-executor = ThreadPoolExecutor(max_workers=32)
+#==========================#
+def cgroup_cpu_quota() -> Optional[float]:
+    """
+    CPU limit of the container in cores, from the cgroup v2 `cpu.max` or the
+    cgroup v1 CFS quota. None when the cgroup sets no limit.
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    for root in ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct"):
+        try:
+            with open(os.path.join(root, "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(root, "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+            return None if quota <= 0 else quota / period
+        except (OSError, ValueError):
+            continue
+
+    return None
+
+#==========================#
+def plan_thread_layout() -> dict:
+    """
+    Split the CPUs this process may actually use between inter-request
+    workers running torch (the inference workers plus the bulk worker) and
+    torch intra-op threads, so that (inference_workers + bulk_workers) *
+    torch_threads stays within the budget, except on a single CPU where each
+    gets one thread anyway. Values set in the config override the computed
+    ones but are clamped to the same budget. Preprocessing and I/O workers
+    run short non-torch tasks and are sized separately.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    quota = cgroup_cpu_quota()
+    cpus = max(1, min(cores, math.ceil(quota)) if quota else cores)
+
+    bulk_workers = 1
+    max_inference_workers = max(1, cpus - bulk_workers)
+    inference_workers = min(THREADS_INFERENCE_WORKERS or max(1, (cpus - bulk_workers) // 2), max_inference_workers)
+
+    max_torch_threads = max(1, cpus // (inference_workers + bulk_workers))
+    torch_threads = min(THREADS_TORCH or max_torch_threads, max_torch_threads)
+
+    return {
+        "cores": cores,
+        "cgroup_quota": quota,
+        "cpus": cpus,
+        "inference_workers": inference_workers,
+        "torch_threads": torch_threads,
+        "preprocess_workers": THREADS_PREPROCESS_WORKERS or max(1, cpus // 2),
+        "io_workers": THREADS_IO_WORKERS or min(32, 4 * cpus),
+        "bulk_workers": bulk_workers,
+    }
+
+layout = plan_thread_layout()
+
+inference_executor = ThreadPoolExecutor(max_workers=layout["inference_workers"], thread_name_prefix="inference")
+preprocess_executor = ThreadPoolExecutor(max_workers=layout["preprocess_workers"], thread_name_prefix="preprocess")
+io_executor = ThreadPoolExecutor(max_workers=layout["io_workers"], thread_name_prefix="io")
+
+# Bulk jobs (re-evaluation, /api/predict) get a single worker so they never take more
+# than one slot away from the live inference path
+bulk_executor = ThreadPoolExecutor(max_workers=layout["bulk_workers"], thread_name_prefix="bulk")
+
+# Generic blocking work goes to the I/O pool
+executor = io_executor
+
+#==========================#
+def configure_torch_threads():
+    """
+    Apply the torch share of the layout. Torch defaults to one intra-op thread
+    per core, which multiplied by the inference workers oversubscribes the CPUs.
+    """
+    import torch
+
+    torch.set_num_threads(layout["torch_threads"])
+    try:
+        torch.set_num_interop_threads(1) # Requests are already parallel across workers
+    except RuntimeError:
+        pass # Can only be set once, before any inter-op work started
+
+#==========================#
+def thread_layout() -> dict:
+    current = dict(layout)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        current["torch_threads_active"] = torch.get_num_threads()
+        current["torch_interop_threads_active"] = torch.get_num_interop_threads()
+    return current
 
 async def run_in_executor(func, *args):
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(executor, func, *args)
\ No newline at end of file
+    return await loop.run_in_executor(executor, func, *args)
+
+async def run_in_inference_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, func, *args)
+
+async def run_in_preprocess_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(preprocess_executor, func, *args)
+
+async def run_in_bulk_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(bulk_executor, func, *args)
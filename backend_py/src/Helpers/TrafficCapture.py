@@ -0,0 +1,160 @@
+from typing import Iterator, NamedTuple, Optional
+import random
+import struct
+import mmap
+import uuid
+import os
+
+# Capture file layout: CAPTURE_MAGIC, then back-to-back records of
+# RECORD_HEADER (kind, unix timestamp, server handling latency in ms,
+# session uuid, payload length) followed by the raw UTF-8 payload.
+CAPTURE_MAGIC = b"CNNCAP01"
+RECORD_HEADER = struct.Struct("<Bdf16sI")
+
+KIND_CONNECT = 0
+KIND_MESSAGE = 1
+KIND_DISCONNECT = 2
+
+#==========================#
+class CaptureRecord(NamedTuple):
+    kind: int
+    timestamp: float
+    latency_ms: float
+    session: uuid.UUID
+    payload: bytes
+
+#==========================#
+class TrafficRecorder:
+    """
+    Append-only recorder of inbound websocket traffic. Sampling is decided per
+    session, so a captured session always has all of its messages, and the file
+    stops growing once it reaches `max_bytes`.
+
+    Writes happen on the event loop. They go to a 64 KiB buffer that is only
+    flushed when it fills up or a captured session ends, which is accepted for
+    a debugging aid. Any I/O error stops the capture instead of reaching the
+    websocket session that triggered it.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0, max_bytes: int = 1 << 30):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.sessions = set()
+        self.full = False
+        self._file = None
+        self._size = 0
+
+    #==========================#
+    def _open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "ab", buffering=1 << 16)
+            self._size = self._file.tell()
+            if self._size == 0:
+                self._file.write(CAPTURE_MAGIC)
+                self._size = len(CAPTURE_MAGIC)
+        return self._file
+
+    #==========================#
+    def _stop(self, reason: str):
+        self.full = True
+        self.sessions.clear()
+        print(f"Traffic capture {self.path} stopped: {reason}")
+
+    #==========================#
+    def _write(self, kind: int, session: uuid.UUID, timestamp: float, latency_ms: float = 0.0, payload: bytes = b"", flush: bool = False):
+        if self.full:
+            return
+
+        size = RECORD_HEADER.size + len(payload)
+        try:
+            file = self._open()
+            if self._size + size > self.max_bytes:
+                self._stop(f"reached {self.max_bytes} bytes")
+                return
+
+            file.write(RECORD_HEADER.pack(kind, timestamp, latency_ms, session.bytes, len(payload)))
+            file.write(payload)
+            self._size += size
+            if flush:
+                file.flush()
+        except OSError as e:
+            self._stop(str(e))
+
+    #==========================#
+    def start_session(self, session: uuid.UUID, timestamp: float):
+        if self.full or random.random() >= self.sample_rate:
+            return
+        self.sessions.add(session)
+        self._write(KIND_CONNECT, session, timestamp)
+
+    #==========================#
+    def record_message(self, session: uuid.UUID, timestamp: float, latency_ms: float, payload: str):
+        if session in self.sessions:
+            self._write(KIND_MESSAGE, session, timestamp, latency_ms, payload.encode("utf-8"))
+
+    #==========================#
+    def end_session(self, session: uuid.UUID, timestamp: float):
+        if session in self.sessions:
+            self.sessions.discard(session)
+            self._write(KIND_DISCONNECT, session, timestamp, flush=True) # Complete sessions are readable while capturing
+
+    #==========================#
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError as e:
+                print(f"Traffic capture {self.path} could not be closed: {e}")
+            self._file = None
+
+#==========================#
+class CaptureReader:
+    """
+    Memory-mapped reader over a capture file: records are decoded lazily and
+    only their payloads are copied out, so captures larger than RAM can be replayed.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size < len(CAPTURE_MAGIC):
+            self._file.close()
+            raise ValueError(
+                f"{path} has no complete capture header yet: the recorder only flushes "
+                f"when a captured session ends, or when the server shuts down"
+            )
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a traffic capture file")
+
+    #==========================#
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        offset = len(CAPTURE_MAGIC)
+        end = len(self._map)
+
+        while offset + RECORD_HEADER.size <= end:
+            kind, timestamp, latency_ms, session, length = RECORD_HEADER.unpack_from(self._map, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > end:
+                break # Truncated trailing record
+            yield CaptureRecord(kind, timestamp, latency_ms, uuid.UUID(bytes=session), self._map[offset:offset + length])
+            offset += length
+
+    #==========================#
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+#==========================#
+def open_recorder(path: str, sample_rate: float, max_bytes: int) -> Optional[TrafficRecorder]:
+    """
+    Recorder for the configured capture path, or None when capture is disabled.
+    """
+    if not path:
+        return None
+    return TrafficRecorder(path, sample_rate=sample_rate, max_bytes=max_bytes)
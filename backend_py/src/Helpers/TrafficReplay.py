@@ -0,0 +1,162 @@
+from Helpers.TrafficCapture import CaptureReader, KIND_CONNECT, KIND_MESSAGE, KIND_DISCONNECT
+import websockets
+import argparse
+import asyncio
+import json
+import time
+
+# Message types answered by one of the response types below
+REQUEST_TYPES = {"mnist-image", "mnist-strokes"}
+RESPONSE_TYPES = {"mnist-prediction", "mnist-prediction-error"}
+
+#==========================#
+class SessionReplayer:
+    """
+    Re-drives one captured session over its own websocket. Sends follow the
+    captured cadence; requests are tagged with an "id" the server echoes, so a
+    separate reader can match responses to them and measure their latency.
+    Requests the server never answers stay pending and are counted as unanswered.
+    """
+
+    def __init__(self, url: str, results: dict, strip_labels: bool = False):
+        self.url = url
+        self.results = results
+        self.strip_labels = strip_labels
+        self.queue = asyncio.Queue()
+        self.pending = {} # request id -> (send time, captured latency) of unanswered requests
+        self.next_id = 0
+        self.task = asyncio.create_task(self.run())
+
+    #==========================#
+    def _prepare(self, payload: str):
+        """
+        Returns:
+            tuple: (request id or None, payload to send)
+        """
+        message = json.loads(payload)
+        if message.get("type") not in REQUEST_TYPES:
+            return None, payload
+
+        if self.strip_labels:
+            data = message["data"]
+            data = json.loads(data) if isinstance(data, str) else data
+            data["real"] = -1 # Keep replays out of the stored images
+            message["data"] = json.dumps(data) if isinstance(message["data"], str) else data
+
+        self.next_id += 1
+        message["id"] = self.next_id
+        return self.next_id, json.dumps(message)
+
+    #==========================#
+    async def _receive(self, websocket):
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                message_type = message.get("type")
+                if message_type in RESPONSE_TYPES and message.get("id") in self.pending:
+                    sent_at, captured_ms = self.pending.pop(message["id"])
+                    self.results["replayed"].append((time.perf_counter() - sent_at) * 1000)
+                    self.results["captured"].append(captured_ms)
+                    if message_type == "mnist-prediction-error":
+                        self.results["errors"] += 1
+        except websockets.ConnectionClosed:
+            pass
+
+    #==========================#
+    async def run(self):
+        try:
+            async with websockets.connect(self.url, max_size=None) as websocket:
+                receiver = asyncio.create_task(self._receive(websocket))
+
+                while (item := await self.queue.get()) is not None:
+                    payload, captured_ms = item
+                    request, payload = self._prepare(payload)
+                    if request is not None:
+                        self.pending[request] = (time.perf_counter(), captured_ms)
+                    await websocket.send(payload)
+
+                # Give the last responses a chance to arrive before closing
+                deadline = time.perf_counter() + 10
+                while self.pending and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.05)
+                receiver.cancel()
+
+        except Exception as e:
+            self.results["failed_sessions"] += 1
+            print(f"Replay session failed: {e}")
+
+        self.results["unanswered"] += len(self.pending)
+
+#==========================#
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+#==========================#
+async def replay(path: str, url: str, speed: float = 1.0, strip_labels: bool = False) -> dict:
+    """
+    Replay a capture against `url`, `speed` times faster than it was recorded.
+    Records are streamed from the memory-mapped file as their time comes.
+    """
+    results = {"replayed": [], "captured": [], "errors": 0, "unanswered": 0, "failed_sessions": 0}
+    sessions = {}
+    running = set() # Replayer tasks not finished yet, including disconnected sessions
+    reader = CaptureReader(path)
+    started = time.perf_counter()
+    first_timestamp = None
+
+    try:
+        for record in reader:
+            if first_timestamp is None:
+                first_timestamp = record.timestamp
+
+            delay = (record.timestamp - first_timestamp) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if record.kind == KIND_CONNECT:
+                replayer = SessionReplayer(url, results, strip_labels)
+                sessions[record.session] = replayer
+                running.add(replayer.task)
+                replayer.task.add_done_callback(running.discard)
+            elif record.session not in sessions or sessions[record.session].task.done():
+                continue # Session started before the capture window, or failed to connect
+            elif record.kind == KIND_MESSAGE:
+                sessions[record.session].queue.put_nowait((record.payload.decode("utf-8"), record.latency_ms))
+            elif record.kind == KIND_DISCONNECT:
+                sessions.pop(record.session).queue.put_nowait(None)
+
+        # Sessions still open at the end of the capture
+        for session in sessions.values():
+            session.queue.put_nowait(None)
+        await asyncio.gather(*running)
+    finally:
+        reader.close()
+
+    return {
+        "requests": len(results["replayed"]),
+        "errors": results["errors"],
+        "unanswered": results["unanswered"],
+        "failed_sessions": results["failed_sessions"],
+        "replayed_latency_ms": percentiles(results["replayed"]),
+        "captured_latency_ms": percentiles(results["captured"]),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+#==========================#
+def main():
+    parser = argparse.ArgumentParser(description="Replay a captured websocket traffic file against a server.")
+    parser.add_argument("capture", help="Capture file written with CAPTURE_PATH")
+    parser.add_argument("--url", default="ws://localhost:5000/ws")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up factor (1 = real time)")
+    parser.add_argument("--strip-labels", action="store_true", help="Send labeled submissions as unlabeled")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.capture, args.url, args.speed, args.strip_labels))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
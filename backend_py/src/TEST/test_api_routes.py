@@ -1,6 +1,9 @@
 import pytest
 import asyncio
 import aiohttp
+import io
+import numpy as np
+from PIL import Image
 import os
 from dotenv import load_dotenv
 
@@ -12,7 +15,11 @@ API_URL = os.getenv("BACKEND_API_URL", f"http://localhost:{5000}")
 API_TEST_ENDPOINTS = [
     "/api/status",
     "/api/images",
-    "/api/helloworld"
+    "/api/helloworld",
+    "/api/connection_stats",
+    "/api/model_stats",
+    "/api/threads",
+    "/api/connections"
 ]
 
 @pytest.mark.asyncio
@@ -37,3 +44,50 @@ async def test_api_endpoints():
                     assert data is not None
 
     await asyncio.gather(*(client_task(i) for i in range(num_clients)))
+
+@pytest.mark.asyncio
+async def test_batch_predict():
+    with open("sample_digit.png", "rb") as f:
+        sample_png = f.read()
+
+    async with aiohttp.ClientSession() as session:
+        # Raw N x 28 x 28 uint8 bitmaps, JSON results
+        async with session.post(f"{API_URL}/api/predict", data=bytes(3 * 28 * 28), headers={"Content-Type": "application/octet-stream"}) as response:
+            assert response.status == 200
+            results = (await response.json())["results"]
+            assert len(results) == 3
+            assert all(0 <= result["prediction"] <= 9 and len(result["probabilities"]) == 10 for result in results)
+
+        # Multipart PNG uploads, binary records (int8 prediction + 10 float32 probabilities)
+        form = aiohttp.FormData()
+        for i in range(2):
+            form.add_field("images", sample_png, filename=f"digit_{i}.png", content_type="image/png")
+        form.add_field("images", b"not a png", filename="broken.png", content_type="image/png")
+        async with session.post(f"{API_URL}/api/predict", data=form, headers={"Accept": "application/octet-stream"}) as response:
+            assert response.status == 200
+            records = await response.read()
+            assert len(records) == 3 * 41
+            assert records[2 * 41] == 0xFF # Undecodable image is predicted as -1
+
+        # A chunked body is capped while it is read
+        async def chunks():
+            for _ in range(80):
+                yield bytes(1024 * 1024)
+
+        async with session.post(f"{API_URL}/api/predict", data=chunks(), headers={"Content-Type": "application/octet-stream"}) as response:
+            assert response.status == 413
+
+        async with session.post(f"{API_URL}/api/predict", data=bytes(100), headers={"Content-Type": "application/octet-stream"}) as response:
+            assert response.status == 400
+
+        # .npy stacks: integer pixels in [0, 255] are not rescaled, they predict like uint8 pixels
+        digit = np.asarray(Image.open("sample_digit.png").convert("L"), dtype=np.int64)
+        pixels = np.stack([digit, digit.T, np.flipud(digit)])
+        results = []
+        for array in (pixels.astype(np.uint8), pixels.astype(np.int64)):
+            buffer = io.BytesIO()
+            np.save(buffer, array)
+            async with session.post(f"{API_URL}/api/predict", data=buffer.getvalue(), headers={"Content-Type": "application/x-npy"}) as response:
+                assert response.status == 200
+                results.append((await response.json())["results"])
+        assert results[0] == results[1]
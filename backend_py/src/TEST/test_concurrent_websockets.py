@@ -2,8 +2,12 @@ import pytest
 import asyncio
 import base64
 import websockets
+import aiohttp
 import json
 import os
+import io
+import numpy as np
+from PIL import Image, ImageDraw
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,10 +19,42 @@ API_URL = os.getenv("BACKEND_API_URL", f"http://localhost:{5000}")
 SAMPLE_IMAGE_PATH = "sample_digit.png"
 SERVER_WS_URL = BACKEND_WS_URL
 
+# A "4" drawn as two strokes of flat [x0, y0, x1, y1, ...] canvas coordinates
+SAMPLE_STROKES = [
+    [80, 40, 60, 150, 200, 150],
+    [170, 60, 170, 250],
+]
+CANVAS_SIZE = 280
+
 def load_sample_image_base64():
     with open(SAMPLE_IMAGE_PATH, "rb") as f:
         return base64.b64encode(f.read()).decode("utf-8")
 
+def render_strokes_base64(strokes, size, line_width):
+    # Canvas-like rendering: antialiased, round-capped white lines on black
+    scale = 4
+    image = Image.new("L", (size * scale, size * scale), 0)
+    draw = ImageDraw.Draw(image)
+    radius = line_width * scale / 2
+    for stroke in strokes:
+        points = [(x * scale, y * scale) for x, y in zip(stroke[0::2], stroke[1::2])]
+        draw.line(points, fill=255, width=round(line_width * scale), joint="curve")
+        for x, y in points:
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=255)
+
+    buffer = io.BytesIO()
+    image.resize((size, size), Image.LANCZOS).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+async def request_prediction(websocket, type, data):
+    await websocket.send(json.dumps({"type": type, "data": data}))
+    while True:
+        parsed = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+        if parsed["type"] == "mnist-prediction":
+            return json.loads(parsed["data"])
+        if parsed["type"] == "mnist-prediction-error":
+            return None
+
 @pytest.mark.asyncio
 async def test_multiple_clients_handle_prediction():
     num_clients = 25
@@ -60,3 +96,104 @@ async def test_multiple_clients_handle_prediction():
 
     # Launch multiple clients concurrently
     await asyncio.gather(*(client_task(i) for i in range(num_clients)))
+
+@pytest.mark.asyncio
+async def test_strokes_match_canvas_rendering():
+    image_data = render_strokes_base64(SAMPLE_STROKES, CANVAS_SIZE, 0.06 * CANVAS_SIZE)
+
+    async with websockets.connect(SERVER_WS_URL) as websocket:
+        canvas = await request_prediction(websocket, "mnist-image", json.dumps({
+            "data": image_data,
+            "real": -1,
+            "name": ""
+        }))
+
+        # Second stroke appended to the first, as the frontend sends them while drawing
+        await request_prediction(websocket, "mnist-strokes", {"strokes": SAMPLE_STROKES[:1], "width": CANVAS_SIZE})
+        strokes = await request_prediction(websocket, "mnist-strokes", {
+            "strokes": SAMPLE_STROKES[1:],
+            "width": CANVAS_SIZE,
+            "append": True
+        })
+
+        # Long zig-zags across the canvas are over the rasterization budget
+        zigzag = [0, 0, CANVAS_SIZE, CANVAS_SIZE] * 1000
+        rejected = await request_prediction(websocket, "mnist-strokes", {"strokes": [zigzag], "width": CANVAS_SIZE})
+
+        # A rejected drawing does not replace the one later strokes are appended to
+        appended = await request_prediction(websocket, "mnist-strokes", {"strokes": [[20, 20, 30, 30]], "width": CANVAS_SIZE, "append": True})
+
+        # Invalid fields are answered with an error, not silence
+        invalid = await request_prediction(websocket, "mnist-strokes", {"strokes": SAMPLE_STROKES, "width": CANVAS_SIZE, "real": "seven"})
+
+    assert canvas is not None and strokes is not None
+    assert strokes["prediction"] == canvas["prediction"]
+
+    # Input images as the model saw them, both scaled to [0, 255]
+    canvas_input = np.array(canvas["visuals"][0]["data"], dtype=np.float64)
+    strokes_input = np.array(strokes["visuals"][0]["data"], dtype=np.float64)
+    print(f"Mean input difference: {np.abs(canvas_input - strokes_input).mean():.2f}/255")
+    assert np.abs(canvas_input - strokes_input).mean() < 3
+
+    assert rejected is None
+    assert appended is not None
+    assert invalid is None
+
+@pytest.mark.asyncio
+async def test_atlas_output():
+    image_data = load_sample_image_base64()
+
+    async with websockets.connect(SERVER_WS_URL) as websocket:
+        prediction = await request_prediction(websocket, "mnist-image", json.dumps({
+            "data": image_data,
+            "real": -1,
+            "name": "",
+            "output": "atlas"
+        }))
+
+        invalid = await request_prediction(websocket, "mnist-image", json.dumps({
+            "data": image_data,
+            "real": -1,
+            "name": "",
+            "output": None
+        }))
+
+    assert prediction is not None
+    assert len(prediction["visuals"]) == 1 # Only the probabilities, the feature maps are in the atlas
+    atlas = prediction["atlas"]
+    assert invalid is None
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{API_URL}{atlas['url']}") as response:
+            assert response.status == 200
+            assert response.headers["Content-Type"] == "image/png"
+            etag = response.headers["ETag"]
+            image = Image.open(io.BytesIO(await response.read()))
+            assert image.size == (atlas["width"], atlas["height"])
+
+        # Content-addressed atlases revalidate without a body
+        async with session.get(f"{API_URL}{atlas['url']}", headers={"If-None-Match": etag}) as response:
+            assert response.status == 304
+            assert await response.read() == b""
+
+@pytest.mark.asyncio
+async def test_failed_session_is_released():
+    async with websockets.connect(SERVER_WS_URL) as websocket:
+        # The server reads text frames only, a binary frame fails the session
+        await websocket.send(b"\x00")
+        with pytest.raises(websockets.exceptions.ConnectionClosed):
+            await asyncio.wait_for(websocket.recv(), timeout=5)
+        assert websocket.close_code == 1011
+
+    async with aiohttp.ClientSession() as session:
+        for _ in range(20):
+            async with session.get(f"{API_URL}/api/connections") as response:
+                connections = (await response.json())["connections"]
+            async with session.get(f"{API_URL}/api/status") as response:
+                status = await response.text()
+            if connections == 0 and status == "0":
+                break
+            await asyncio.sleep(0.1)
+
+    assert connections == 0
+    assert status == "0"
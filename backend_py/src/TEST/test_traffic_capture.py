@@ -0,0 +1,41 @@
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from Helpers.TrafficCapture import TrafficRecorder, CaptureReader, KIND_CONNECT, KIND_MESSAGE, KIND_DISCONNECT
+
+def test_capture_round_trip(tmp_path):
+    path = tmp_path / "capture.bin"
+    recorder = TrafficRecorder(str(path))
+    session = uuid.uuid4()
+
+    recorder.start_session(session, 1000.0)
+    recorder.record_message(session, 1000.5, 12.5, '{"type": "ping", "data": "é"}')
+    recorder.end_session(session, 1001.0)
+    recorder.close()
+
+    reader = CaptureReader(str(path))
+    records = [(r.kind, r.timestamp, r.latency_ms, r.session, bytes(r.payload)) for r in reader]
+    reader.close()
+
+    assert records == [
+        (KIND_CONNECT, 1000.0, 0.0, session, b""),
+        (KIND_MESSAGE, 1000.5, 12.5, session, '{"type": "ping", "data": "é"}'.encode("utf-8")),
+        (KIND_DISCONNECT, 1001.0, 0.0, session, b""),
+    ]
+
+def test_capture_io_error_stops_capture(tmp_path):
+    # The capture directory is a file, so opening the capture fails
+    (tmp_path / "not_a_directory").write_bytes(b"")
+    recorder = TrafficRecorder(str(tmp_path / "not_a_directory" / "capture.bin"))
+    session = uuid.uuid4()
+
+    recorder.start_session(session, 1000.0)
+    recorder.record_message(session, 1000.5, 1.0, "{}")
+    recorder.end_session(session, 1001.0)
+    recorder.close()
+
+    assert recorder.full
+    assert not recorder.sessions
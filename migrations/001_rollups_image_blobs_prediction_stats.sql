@@ -0,0 +1,46 @@
+--
+-- One-off migration of an existing database to the tables the backend now
+-- expects (mnist_schema.sql already contains them for new databases).
+-- Run once, as the owner of mnist_images:
+--
+--   psql "$DATABASE_URL" -f migrations/001_rollups_image_blobs_prediction_stats.sql
+--
+
+BEGIN;
+
+-- Per-minute connection rollups served by /api/connection_stats
+CREATE TABLE IF NOT EXISTS public.connection_rollups (
+    bucket timestamp with time zone PRIMARY KEY,
+    connects integer DEFAULT 0 NOT NULL,
+    peak_concurrent integer DEFAULT 0 NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS public.connection_duration_rollups (
+    bucket timestamp with time zone NOT NULL,
+    bin smallint NOT NULL,
+    sessions integer DEFAULT 0 NOT NULL,
+    PRIMARY KEY (bucket, bin)
+);
+
+-- Content-addressed image storage: one normalized 28x28 uint8 bitmap per
+-- distinct drawing, shared by every submission that produces it.
+CREATE TABLE IF NOT EXISTS public.image_blobs (
+    hash bytea PRIMARY KEY,
+    bitmap bytea NOT NULL,
+    original bytea,
+    last_used_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+-- Older rows keep their canvas PNG in image_data, new rows only reference a blob
+ALTER TABLE public.mnist_images ADD COLUMN IF NOT EXISTS image_hash bytea;
+ALTER TABLE public.mnist_images ALTER COLUMN image_data DROP NOT NULL;
+CREATE INDEX IF NOT EXISTS mnist_images_image_hash_idx ON public.mnist_images USING btree (image_hash);
+
+-- Single-row snapshot of the in-memory PredictionStatistics counters
+CREATE TABLE IF NOT EXISTS public.prediction_stats (
+    id smallint PRIMARY KEY,
+    payload jsonb NOT NULL,
+    updated_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+COMMIT;
@@ -21,18 +21,59 @@ SET default_tablespace = '';
 
 SET default_table_access_method = heap;
 
+--
+-- Name: connection_duration_rollups; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.connection_duration_rollups (
+    bucket timestamp with time zone NOT NULL,
+    bin smallint NOT NULL,
+    sessions integer DEFAULT 0 NOT NULL
+);
+
+
+ALTER TABLE public.connection_duration_rollups OWNER TO postgres;
+
+--
+-- Name: connection_rollups; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.connection_rollups (
+    bucket timestamp with time zone NOT NULL,
+    connects integer DEFAULT 0 NOT NULL,
+    peak_concurrent integer DEFAULT 0 NOT NULL
+);
+
+
+ALTER TABLE public.connection_rollups OWNER TO postgres;
+
+--
+-- Name: image_blobs; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.image_blobs (
+    hash bytea NOT NULL,
+    bitmap bytea NOT NULL,
+    original bytea,
+    last_used_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.image_blobs OWNER TO postgres;
+
 --
 -- Name: mnist_images; Type: TABLE; Schema: public; Owner: postgres
 --
 
 CREATE TABLE public.mnist_images (
     id integer NOT NULL,
-    image_data bytea NOT NULL,
+    image_data bytea,
     prediction integer NOT NULL,
     "real" integer NOT NULL,
     client_port integer,
     client_name text,
-    created_at timestamp without time zone DEFAULT now()
+    created_at timestamp without time zone DEFAULT now(),
+    image_hash bytea
 );
 
 
@@ -53,6 +94,19 @@ CREATE SEQUENCE public.mnist_images_id_seq
 
 ALTER SEQUENCE public.mnist_images_id_seq OWNER TO postgres;
 
+--
+-- Name: prediction_stats; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.prediction_stats (
+    id smallint NOT NULL,
+    payload jsonb NOT NULL,
+    updated_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.prediction_stats OWNER TO postgres;
+
 --
 -- Name: mnist_images_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: postgres
 --
@@ -67,6 +121,30 @@ ALTER SEQUENCE public.mnist_images_id_seq OWNED BY public.mnist_images.id;
 ALTER TABLE ONLY public.mnist_images ALTER COLUMN id SET DEFAULT nextval('public.mnist_images_id_seq'::regclass);
 
 
+--
+-- Name: connection_duration_rollups connection_duration_rollups_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.connection_duration_rollups
+    ADD CONSTRAINT connection_duration_rollups_pkey PRIMARY KEY (bucket, bin);
+
+
+--
+-- Name: connection_rollups connection_rollups_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.connection_rollups
+    ADD CONSTRAINT connection_rollups_pkey PRIMARY KEY (bucket);
+
+
+--
+-- Name: image_blobs image_blobs_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.image_blobs
+    ADD CONSTRAINT image_blobs_pkey PRIMARY KEY (hash);
+
+
 --
 -- Name: mnist_images mnist_images_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
 --
@@ -75,6 +153,21 @@ ALTER TABLE ONLY public.mnist_images
     ADD CONSTRAINT mnist_images_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: prediction_stats prediction_stats_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.prediction_stats
+    ADD CONSTRAINT prediction_stats_pkey PRIMARY KEY (id);
+
+
+--
+-- Name: mnist_images_image_hash_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX mnist_images_image_hash_idx ON public.mnist_images USING btree (image_hash);
+
+
 --
 -- PostgreSQL database dump complete
 --